@@ -0,0 +1,176 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend:
+    """Minimal key/value interface the response cache stores through; awaited so network
+    backends never block the event loop"""
+
+    name = "base"
+
+    async def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: str, ttl: int):
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class InMemoryCache(CacheBackend):
+    """In-process LRU cache with per-entry TTL and a cap on entries and total UTF-8 bytes"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value, _ = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    async def set(self, key: str, value: str, ttl: int):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class RedisCache(CacheBackend):
+    """Cache stored in Redis or any Redis-compatible server (Valkey, KeyDB, Dragonfly).
+
+    Eviction is left to the server's own maxmemory policy; entries expire via SETEX.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str = "provolx:chat:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise ValueError("The redis package (4.2 or later) is required for RESPONSE_CACHE_BACKEND=redis")
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, socket_timeout=0.25)
+
+    async def get(self, key: str) -> Optional[str]:
+        value = await self._client.get(self.prefix + key)
+        return value.decode("utf-8") if value is not None else None
+
+    async def set(self, key: str, value: str, ttl: int):
+        await self._client.setex(self.prefix + key, ttl, value)
+
+
+def create_backend(kind: str, **options) -> Optional[CacheBackend]:
+    """Build a cache backend by name; "none" disables caching"""
+    kind = (kind or "memory").lower()
+    if kind == "none":
+        return None
+    if kind == "memory":
+        return InMemoryCache(
+            max_entries=options.get("max_entries", 1024),
+            max_bytes=options.get("max_bytes", 64 * 1024 * 1024),
+        )
+    if kind == "redis":
+        return RedisCache(options.get("redis_url") or "redis://localhost:6379/0")
+    raise ValueError(f"Unknown cache backend: {kind}")
+
+
+class ResponseCache:
+    """Caches chat answers keyed on a hash of the assembled prompt"""
+
+    def __init__(self, backend: Optional[CacheBackend], ttl: int = 3600):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    @staticmethod
+    def key_for(prompt: str, model_name: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{prompt}".encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            # A broken cache must never fail the request
+            self.errors += 1
+            logger.warning("Response cache read failed", extra={"error": str(e)})
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    async def set(self, key: str, result: Dict[str, Any]):
+        if not self.enabled:
+            return
+        try:
+            await self.backend.set(key, json.dumps(result), self.ttl)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Response cache write failed", extra={"error": str(e)})
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend.name if self.backend else "none",
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            **(self.backend.stats() if self.backend else {}),
+        }
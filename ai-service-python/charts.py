@@ -0,0 +1,389 @@
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import TYPE_CHECKING, Any, Dict, Optional, Union
+
+from sheets import is_arrow_table
+
+logger = logging.getLogger(__name__)
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+
+HISTOGRAM_BINS = 20
+TOP_CATEGORIES = 10
+FIGURE_SIZE = (10, 6)
+VEGA_LITE_SCHEMA = "https://vega.github.io/schema/vega-lite/v5.json"
+
+# Everything besides the data that changes the rendered image; bump the
+# version when the drawing code changes so cached charts are not reused
+CHART_PARAMS = f"v1:bins={HISTOGRAM_BINS}:top={TOP_CATEGORIES}:size={FIGURE_SIZE}:png"
+
+
+def chart_cache_key(data_fingerprint: str) -> str:
+    """Content address of the chart for a given sheet"""
+    return hashlib.sha256(f"{CHART_PARAMS}\0{data_fingerprint}".encode("utf-8")).hexdigest()
+
+
+def chart_spec(data: Union["pd.DataFrame", "pa.Table"]) -> Optional[Dict[str, Any]]:
+    """Pick a chart for the sheet and pre-aggregate its data.
+
+    A histogram of the first numeric column, otherwise a bar chart of the
+    ten most common values of the first text column. Only these aggregates
+    are sent to the render worker, never the rows themselves.
+    """
+    import numpy as np
+
+    if is_arrow_table(data):
+        return _table_chart_spec(data)
+    df = data
+
+    numerical_columns = df.select_dtypes(include=['number']).columns
+    if len(numerical_columns) > 0:
+        column = numerical_columns[0]
+        counts, edges = np.histogram(df[column].dropna().to_numpy(dtype=float), bins=HISTOGRAM_BINS)
+        return {
+            "type": "histogram",
+            "column": str(column),
+            "counts": counts.tolist(),
+            "edges": edges.tolist(),
+        }
+
+    categorical_columns = df.select_dtypes(include=['object']).columns
+    if len(categorical_columns) > 0:
+        column = categorical_columns[0]
+        value_counts = df[column].value_counts().head(TOP_CATEGORIES)
+        return {
+            "type": "bar",
+            "column": str(column),
+            "labels": [str(label) for label in value_counts.index],
+            "counts": [int(count) for count in value_counts.values],
+        }
+
+    return None
+
+
+def _table_chart_spec(table: "pa.Table") -> Optional[Dict[str, Any]]:
+    """chart_spec for an uploaded sheet's Arrow table, reading only the charted column"""
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    for field in table.schema:
+        if pa.types.is_integer(field.type) or pa.types.is_floating(field.type):
+            values = pc.drop_null(table.column(field.name)).to_numpy().astype(float)
+            counts, edges = np.histogram(values[~np.isnan(values)], bins=HISTOGRAM_BINS)
+            return {
+                "type": "histogram",
+                "column": field.name,
+                "counts": counts.tolist(),
+                "edges": edges.tolist(),
+            }
+
+    for field in table.schema:
+        if pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+            value_counts = pc.value_counts(pc.drop_null(table.column(field.name)))
+            top = value_counts.take(pc.array_sort_indices(value_counts.field("counts"), order="descending")[:TOP_CATEGORIES])
+            return {
+                "type": "bar",
+                "column": field.name,
+                "labels": [str(label) for label in top.field("values").to_pylist()],
+                "counts": [int(count) for count in top.field("counts").to_pylist()],
+            }
+
+    return None
+
+
+def vega_lite_spec(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """The same chart as a Vega-Lite spec with its aggregates inlined, for rendering client-side.
+
+    Data fields use fixed names rather than the sheet's column name, which
+    Vega-Lite would otherwise parse as a field path.
+    """
+    column = spec["column"]
+    if spec["type"] == "histogram":
+        edges = spec["edges"]
+        values = [
+            {"bin_start": start, "bin_end": end, "count": count}
+            for start, end, count in zip(edges[:-1], edges[1:], spec["counts"])
+        ]
+        title = f"Distribution of {column}"
+        encoding = {
+            "x": {"field": "bin_start", "type": "quantitative", "bin": {"binned": True}, "title": column},
+            "x2": {"field": "bin_end"},
+            "y": {"field": "count", "type": "quantitative", "title": "Frequency"},
+        }
+    else:
+        values = [{"label": label, "count": count} for label, count in zip(spec["labels"], spec["counts"])]
+        title = f"Top {TOP_CATEGORIES} {column} Values"
+        encoding = {
+            "x": {"field": "label", "type": "nominal", "sort": "-y", "title": column},
+            "y": {"field": "count", "type": "quantitative", "title": "Count"},
+        }
+
+    return {
+        "$schema": VEGA_LITE_SCHEMA,
+        "title": title,
+        "width": "container",
+        "data": {"values": values},
+        "mark": {"type": "bar", "tooltip": True},
+        "encoding": encoding,
+    }
+
+
+def render_chart(spec: Dict[str, Any]) -> bytes:
+    """Draw a chart spec to PNG bytes. Runs inside a render worker process."""
+    # The object-oriented Figure API keeps no global state, unlike pyplot
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=FIGURE_SIZE)
+    ax = fig.subplots()
+    column = spec["column"]
+
+    if spec["type"] == "histogram":
+        edges = spec["edges"]
+        ax.hist(edges[:-1], bins=edges, weights=spec["counts"], alpha=0.7)
+        ax.set_title(f'Distribution of {column}')
+        ax.set_xlabel(column)
+        ax.set_ylabel('Frequency')
+    else:
+        positions = range(len(spec["counts"]))
+        ax.bar(positions, spec["counts"])
+        ax.set_title(f'Top {TOP_CATEGORIES} {column} Values')
+        ax.set_xlabel(column)
+        ax.set_ylabel('Count')
+        ax.set_xticks(positions)
+        ax.set_xticklabels(spec["labels"], rotation=45)
+
+    fig.tight_layout()
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    return buf.getvalue()
+
+
+class ChartCache:
+    """Content-addressed store of rendered charts.
+
+    A byte-capped in-memory LRU, optionally backed by a directory on disk
+    that survives restarts and is shared by workers on the same host.
+    Entries never go stale since the key covers the data and chart
+    parameters, so there is no TTL.
+
+    Disk reads, writes and trims run in a thread so they never block the
+    event loop. The directory's size is a running total, rescanned only at
+    start, when it passes the cap, or every DISK_RESCAN_SECONDS to pick up
+    other workers' writes.
+    """
+
+    DISK_RESCAN_SECONDS = 60.0
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, disk_dir: Optional[str] = None, disk_max_bytes: int = 512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk_bytes: Optional[int] = None  # unknown until the first scan
+        self._disk_scanned_at = 0.0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_trims = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return image
+
+        image = await asyncio.to_thread(self._read_disk, key) if self.disk_dir else None
+        if image is not None:
+            self.disk_hits += 1
+            self._remember(key, image)
+            return image
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, image: bytes):
+        self._remember(key, image)
+        if self.disk_dir:
+            await asyncio.to_thread(self._write_disk, key, image)
+
+    def _remember(self, key: str, image: bytes):
+        if len(image) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = image
+            self._bytes += len(image)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.png")
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                image = f.read()
+        except OSError:
+            return None
+        try:
+            # Trimming drops the oldest mtimes first, so a read keeps the file
+            os.utime(path)
+        except OSError:
+            pass
+        return image
+
+    def _write_disk(self, key: str, image: bytes):
+        try:
+            path = self._path(key)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(image)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Chart cache disk write failed", extra={"error": str(e)})
+            return
+        with self._disk_lock:
+            stale = time.monotonic() - self._disk_scanned_at > self.DISK_RESCAN_SECONDS
+            if self._disk_bytes is None or stale:
+                self._disk_bytes = self._scan_disk()[1]
+            else:
+                self._disk_bytes += len(image)
+            if self._disk_bytes > self.disk_max_bytes:
+                self._trim_disk()
+
+    def _scan_disk(self):
+        files = []
+        total = 0
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith(".png"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # removed by another worker mid-scan
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        self._disk_scanned_at = time.monotonic()
+        return files, total
+
+    def _trim_disk(self):
+        files, total = self._scan_disk()
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._disk_bytes = total
+        self.disk_trims += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "disk_dir": self.disk_dir,
+            "disk_bytes": self._disk_bytes,
+            "disk_max_bytes": self.disk_max_bytes,
+            "disk_trims": self.disk_trims,
+        }
+
+
+def _init_worker():
+    os.environ["MPLBACKEND"] = "Agg"
+    import matplotlib
+    matplotlib.use("Agg")
+    # Pay matplotlib's import cost once per worker, not on the first chart
+    import matplotlib.figure  # noqa: F401
+
+
+def _warmup() -> int:
+    return os.getpid()
+
+
+class ChartRenderer:
+    """Renders charts in a pool of worker processes so matplotlib never runs on the event loop"""
+
+    def __init__(self, pool_size: int = 2, timeout: float = 10.0):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.rendered = 0
+        self.timeouts = 0
+        self.failures = 0
+
+    def start(self):
+        """Create the pool and fork every worker up front, without waiting for them.
+
+        Forking early, before the Gemini client starts its threads, keeps the
+        workers' copy of the process clean. With the fork start method all
+        workers are forked by the first submit; each then imports matplotlib
+        in the background, so startup does not wait on it.
+        """
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.pool_size, initializer=_init_worker)
+            for _ in range(self.pool_size):
+                self._pool.submit(_warmup)
+
+    async def render(self, spec: Dict[str, Any]) -> Optional[bytes]:
+        if self._pool is None:
+            self.start()
+        loop = asyncio.get_running_loop()
+        try:
+            image = await asyncio.wait_for(loop.run_in_executor(self._pool, render_chart, spec), self.timeout)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM); drop the pool so the next render starts a fresh one
+            self.failures += 1
+            logger.warning("Chart render pool broke; restarting it")
+            self._pool = None
+            return None
+        except asyncio.TimeoutError:
+            # The worker finishes the job in the background; the caller just stops waiting
+            self.timeouts += 1
+            logger.warning("Chart render timed out", extra={"timeout_seconds": self.timeout})
+            return None
+        except Exception:
+            self.failures += 1
+            logger.exception("Error rendering chart")
+            return None
+        self.rendered += 1
+        return image
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pool_size": self.pool_size,
+            "timeout_seconds": self.timeout,
+            "rendered": self.rendered,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,149 @@
+import re
+from collections import Counter
+from functools import lru_cache
+from itertools import chain, islice
+from operator import methodcaller
+from typing import Any, Dict, List, Optional, Tuple
+
+# Keywords per data type. Dict order is the tie-break priority when two
+# types score the same, matching the order the old first-match checks used.
+DATA_TYPE_KEYWORDS: Dict[str, List[str]] = {
+    "Automotive/Vehicle": [
+        'vehicle', 'car', 'model', 'make', 'year', 'mileage', 'vin',
+        'engine', 'transmission', 'fuel', 'maintenance', 'service'
+    ],
+    "Service Records": [
+        'service', 'appointment', 'booking', 'technician', 'repair',
+        'diagnosis', 'labor', 'parts', 'cost', 'invoice'
+    ],
+    "Customer Data": [
+        'customer', 'client', 'name', 'phone', 'email', 'address',
+        'loyalty', 'feedback', 'satisfaction', 'complaint'
+    ],
+    "Sales Data": [
+        'sale', 'purchase', 'price', 'dealer', 'salesperson',
+        'transaction', 'payment', 'financing'
+    ],
+    "Inventory Data": [
+        'inventory', 'stock', 'parts', 'sku', 'quantity',
+        'supplier', 'warehouse', 'location'
+    ],
+}
+
+DEFAULT_DATA_TYPE = "General Data"
+
+# Column names describe the sheet far better than cell values do
+COLUMN_WEIGHT = 2.0
+VALUE_WEIGHT = 1.0
+SAMPLE_ROWS = 5
+SAMPLE_VALUES = 50
+# Exact tokens cost more per column than the old substring scan, so wide sheets are
+# classified from evenly spaced column names; the scores are relative, so the ranking holds
+SAMPLE_COLUMNS = 32
+
+# Words in camelCase, PascalCase, snake_case or plain text: "VehicleID" -> Vehicle, ID
+TOKEN = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|[0-9]+")
+
+MAX_MEMOIZED_TEXTS = 65536
+
+_column_name = methodcaller("get", "name", "")
+_is_text = str.__instancecheck__
+
+
+def _word_forms(word: str) -> List[str]:
+    """A keyword and its plurals, so "cars", "sales" and "quantities" match exactly"""
+    forms = [word, word + "s", word + "es"]
+    if word.endswith("y"):
+        forms.append(word[:-1] + "ies")
+    return forms
+
+
+def _build_index(keywords: Dict[str, List[str]]) -> Dict[str, Tuple[str, ...]]:
+    """Every keyword form mapped to the data types it counts for"""
+    index: Dict[str, Tuple[str, ...]] = {}
+    for category, words in keywords.items():
+        for word in words:
+            for form in _word_forms(word):
+                if category not in index.get(form, ()):
+                    index[form] = index.get(form, ()) + (category,)
+    return index
+
+
+_DEFAULT_INDEX = _build_index(DATA_TYPE_KEYWORDS)
+
+
+def _spread(items: List[Any], limit: int) -> List[Any]:
+    """At most `limit` items, evenly spaced"""
+    return items if len(items) <= limit else items[::-(-len(items) // limit)]
+
+
+class DataTypeClassifier:
+    """Scores every data type over tokenized column names and sample values.
+
+    Tokens must equal a keyword or its plural; a dictionary lookup per token
+    replaces substring matching, so "Cardholder" or "Vinyl" do not count as
+    automotive. At most SAMPLE_COLUMNS names are scored, so the cost does not
+    grow with the sheet's width. Matches per distinct column name or cell
+    value are memoized, and so is the whole ranking per (column names, sample
+    values), so a sheet sent again on the next turn costs one lookup.
+    """
+
+    def __init__(self, keywords: Dict[str, List[str]] = DATA_TYPE_KEYWORDS):
+        self.priority = {category: i for i, category in enumerate(keywords)}
+        self._index = _DEFAULT_INDEX if keywords is DATA_TYPE_KEYWORDS else _build_index(keywords)
+        self._text_hits: Dict[str, Tuple[str, ...]] = {}
+        self._ranked = lru_cache(maxsize=1024)(self._rank)
+
+    def _match_text(self, text: str) -> Tuple[str, ...]:
+        """Categories hit by each token of a column name or cell value, with repeats"""
+        index = self._index
+        hits: Tuple[str, ...] = ()
+        for token in TOKEN.findall(text):
+            hits += index.get(token.lower(), ())
+        if len(self._text_hits) >= MAX_MEMOIZED_TEXTS:
+            self._text_hits.clear()
+        self._text_hits[text] = hits
+        return hits
+
+    def _score(self, texts: Tuple[str, ...], weight: float, scores: Dict[str, float]):
+        # Memoized texts are looked up and counted at C speed; only unseen ones are tokenized
+        text_hits = self._text_hits
+        hits = list(map(text_hits.get, texts))
+        if None in hits:
+            hits = [
+                found if found is not None else text_hits[text] if text in text_hits else self._match_text(text)
+                for text, found in zip(texts, hits)
+            ]
+        for category, count in Counter(chain.from_iterable(hits)).items():
+            scores[category] = scores.get(category, 0.0) + count * weight
+
+    def _rank(self, column_names: Tuple[str, ...], sample_values: Tuple[str, ...]) -> Tuple[Tuple[str, float], ...]:
+        scores: Dict[str, float] = {}
+        self._score(column_names, COLUMN_WEIGHT, scores)
+        self._score(sample_values, VALUE_WEIGHT, scores)
+
+        total = sum(scores.values())
+        if not total:
+            return ((DEFAULT_DATA_TYPE, 1.0),)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], self.priority[item[0]]))
+        return tuple((category, round(score / total, 3)) for category, score in ranked)
+
+    def rank(self, columns: Optional[List[Dict[str, Any]]], data_preview: Optional[List[Any]]) -> List[Tuple[str, float]]:
+        """Ranked (data type, confidence) pairs; confidences sum to 1"""
+        if not columns:
+            return [(DEFAULT_DATA_TYPE, 1.0)]
+
+        # Only text cells carry category hints; a bounded sample keeps wide sheets cheap
+        rows = [
+            row.values() if isinstance(row, dict) else row if isinstance(row, (list, tuple)) else (row,)
+            for row in (data_preview or [])[:SAMPLE_ROWS]
+        ]
+        sample_values = tuple(islice(filter(_is_text, chain.from_iterable(rows)), SAMPLE_VALUES))
+        column_names = tuple(map(str, map(_column_name, _spread(columns, SAMPLE_COLUMNS))))
+        return list(self._ranked(column_names, sample_values))
+
+    def cache_info(self):
+        return {
+            "rankings": self._ranked.cache_info()._asdict(),
+            "texts": len(self._text_hits),
+        }
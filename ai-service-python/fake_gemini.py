@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Gemini REST API with fault injection.
+
+Exercises the service's rate limiting, retries and circuit breaker without a
+real API key or quota:
+
+    python fake_gemini.py --port 8090 --latency 0.2 --error-rate 0.1
+    GEMINI_API_ENDPOINT=http://localhost:8090 python main.py
+
+Faults can be changed while it runs:
+
+    curl -X POST localhost:8090/_faults -H 'Content-Type: application/json' \
+         -d '{"error_rate": 1.0, "error_status": 503}'
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import deque
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+STATUS_NAMES = {
+    400: "INVALID_ARGUMENT",
+    429: "RESOURCE_EXHAUSTED",
+    500: "INTERNAL",
+    503: "UNAVAILABLE",
+    504: "DEADLINE_EXCEEDED",
+}
+
+app = FastAPI(title="Fake Gemini")
+
+
+class Faults(BaseModel):
+    latency: float = 0.0  # seconds before answering (and between streamed chunks)
+    error_rate: float = 0.0  # share of requests answered with error_status
+    error_status: int = 503
+    rpm: int = 0  # requests per minute before answering 429; 0 = unlimited
+
+
+faults = Faults()
+counters = {"requests": 0, "errors": 0, "rate_limited": 0}
+recent = deque()
+
+
+def error_response(status: int, message: str) -> JSONResponse:
+    body = {"error": {"code": status, "message": message, "status": STATUS_NAMES.get(status, "UNKNOWN")}}
+    return JSONResponse(status_code=status, content=body)
+
+
+def injected_fault() -> Optional[JSONResponse]:
+    counters["requests"] += 1
+    now = time.monotonic()
+    while recent and recent[0] < now - 60:
+        recent.popleft()
+    recent.append(now)
+
+    if faults.rpm and len(recent) > faults.rpm:
+        counters["rate_limited"] += 1
+        return error_response(429, "Quota exceeded for requests per minute")
+    if random.random() < faults.error_rate:
+        counters["errors"] += 1
+        return error_response(faults.error_status, "Injected fault")
+    return None
+
+
+def candidate(text: str) -> dict:
+    return {
+        "candidates": [{
+            "content": {"parts": [{"text": text}], "role": "model"},
+            "finishReason": "STOP",
+            "index": 0,
+        }]
+    }
+
+
+def fake_answer(body: dict) -> str:
+    prompt = " ".join(
+        part.get("text", "")
+        for content in body.get("contents", [])
+        for part in content.get("parts", [])
+    )
+    return f"Fake Gemini answer for a {len(prompt):,}-character prompt."
+
+
+@app.post("/v1beta/models/{target}")
+async def models(target: str, request: Request):
+    model, _, method = target.partition(":")
+    if method not in ("generateContent", "streamGenerateContent"):
+        raise HTTPException(status_code=404, detail=f"Unknown method {method!r}")
+
+    body = await request.json()
+    await asyncio.sleep(faults.latency)
+    fault = injected_fault()
+    if fault is not None:
+        return fault
+
+    answer = fake_answer(body)
+    if method == "generateContent":
+        return candidate(answer)
+
+    # REST streaming returns one JSON array, delivered element by element
+    words = answer.split(" ")
+    chunks = [" ".join(words[i:i + 3]) + " " for i in range(0, len(words), 3)]
+
+    async def stream():
+        yield "["
+        for i, chunk in enumerate(chunks):
+            if i:
+                await asyncio.sleep(faults.latency)
+                yield ","
+            yield json.dumps(candidate(chunk))
+        yield "]"
+
+    return StreamingResponse(stream(), media_type="application/json")
+
+
+@app.get("/_faults")
+def get_faults():
+    return {"faults": faults.model_dump(), **counters}
+
+
+@app.post("/_faults")
+def set_faults(update: Faults):
+    global faults
+    faults = update
+    return get_faults()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Gemini REST API for local resilience testing")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--rpm", type=int, default=0)
+    args = parser.parse_args()
+
+    faults = Faults(latency=args.latency, error_rate=args.error_rate, error_status=args.error_status, rpm=args.rpm)
+    uvicorn.run(app, host="127.0.0.1", port=args.port)
@@ -0,0 +1,174 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# Rough chars-per-token ratio for English text with Gemini's tokenizer; good
+# enough to keep prompts bounded without a network round-trip to count_tokens
+CHARS_PER_TOKEN = 4
+
+# Share of the history budget reserved for recent turns kept verbatim
+RECENT_SHARE = 0.75
+
+SUMMARY_TURN_CHARS = 160
+
+# Condensed turns kept per session; older ones are only counted as omitted
+SUMMARY_MAX_LINES = 64
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local token estimate"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def format_turn(turn: Dict) -> str:
+    return f"{turn['role']}: {turn['content']}"
+
+
+def truncate_middle(text: str, max_tokens: int) -> str:
+    """Text cut down to about `max_tokens` tokens, keeping its start and end around a marker"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    keep = max(0, max_tokens * CHARS_PER_TOKEN - 40)  # room for the marker
+    head = text[:keep // 2]
+    tail = text[len(text) - (keep - len(head)):] if keep else ""
+    return f"{head} [... {len(text) - keep:,} characters omitted ...] {tail}"
+
+
+def condense_turn(turn: Dict) -> str:
+    """One short line standing in for an older turn: its first sentence, truncated"""
+    content = " ".join(str(turn.get('content', '')).split())
+    first = re.split(r"(?<=[.!?])\s", content, maxsplit=1)[0]
+    if len(first) > SUMMARY_TURN_CHARS:
+        first = first[:SUMMARY_TURN_CHARS - 3].rstrip() + "..."
+    return f"- {turn['role']}: {first}"
+
+
+class _SessionSummary:
+    def __init__(self):
+        self.turns = 0  # how many leading turns the summary covers
+        self.first = 0  # turn that lines[0] condenses; earlier ones were dropped
+        self.digest = ""  # hash of those turns, to notice when the client rewrites history
+        self.lines: List[str] = []
+
+
+class HistoryManager:
+    """Keeps conversation history within a token budget.
+
+    The most recent turns are sent verbatim; a newest turn that is over
+    budget on its own is cut in the middle. Older turns are folded into a
+    rolling summary stored per session and extended incrementally, so each
+    turn only condenses the turns that just aged out of the verbatim window.
+    A session keeps at most `max_summary_lines` condensed turns.
+    """
+
+    def __init__(self, token_budget: int = 3000, max_sessions: int = 1024, max_summary_lines: int = SUMMARY_MAX_LINES):
+        self.token_budget = token_budget
+        self.max_sessions = max_sessions
+        self.max_summary_lines = max_summary_lines
+        self._sessions: "OrderedDict[str, _SessionSummary]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.compactions = 0
+        self.incremental_updates = 0
+
+    @staticmethod
+    def session_key(session_id: Optional[str], token: str, history: List[Dict]) -> str:
+        """Explicit session ID, or one derived from the caller and the conversation's opening turn"""
+        if session_id:
+            return session_id
+        opening = format_turn(history[0]) if history else ""
+        return hashlib.sha256(f"{token}\0{opening}".encode("utf-8")).hexdigest()
+
+    def render(self, history: List[Dict], session_key: str, token_budget: Optional[int] = None) -> str:
+        """History text for the prompt, compacted when it would exceed the budget"""
+        if not history:
+            return ""
+        budget = self.token_budget if token_budget is None else min(token_budget, self.token_budget)
+        if budget <= 0:
+            return ""
+        lines = [format_turn(turn) for turn in history]
+        if estimate_tokens("\n".join(lines)) <= budget:
+            return "\n".join(lines)
+
+        recent_budget = int(budget * RECENT_SHARE)
+        split = self._recent_start(lines, recent_budget)
+        recent = lines[split:]
+        if not recent:
+            # The newest turn alone is over budget; send as much of it as fits
+            split = len(lines) - 1
+            recent = [truncate_middle(lines[-1], recent_budget)]
+        dropped, summary = self._summary_lines(session_key, history, split)
+        summary_budget = budget - estimate_tokens("\n".join(recent))
+
+        # Oldest summary lines go first if the summary itself outgrows its share
+        while summary and estimate_tokens("\n".join(summary)) > summary_budget:
+            summary = summary[1:]
+            dropped += 1
+
+        parts = ["Summary of earlier conversation:"]
+        if dropped:
+            parts.append(f"- ({dropped} earlier turns omitted)")
+        parts += summary
+        parts.append("Recent conversation:")
+        parts += recent
+        self.compactions += 1
+        return "\n".join(parts)
+
+    def _recent_start(self, lines: List[str], budget: int) -> int:
+        """Index of the oldest turn that still fits, walking back from the newest"""
+        used = 0
+        start = len(lines)
+        while start > 0:
+            cost = estimate_tokens(lines[start - 1]) + 1
+            if used + cost > budget:
+                break
+            used += cost
+            start -= 1
+        return start
+
+    def _summary_lines(self, session_key: str, history: List[Dict], upto: int) -> Tuple[int, List[str]]:
+        """Condensed lines for turns before `upto`: how many leading turns were dropped, and the lines"""
+        with self._lock:
+            state = self._sessions.get(session_key)
+            if state is None:
+                state = self._sessions[session_key] = _SessionSummary()
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            self._sessions.move_to_end(session_key)
+
+            if state.turns and self._digest(history[:state.turns]) != state.digest:
+                # History was edited or truncated by the client; rebuild from scratch
+                state.lines, state.turns, state.first = [], 0, 0
+
+            covered = min(state.turns, upto)
+            kept = state.lines[:covered - state.first] if covered > state.first else []
+            if kept:
+                self.incremental_updates += 1
+                first, start = state.first, covered
+            else:
+                first = start = max(0, upto - self.max_summary_lines)
+
+            lines = kept + [condense_turn(turn) for turn in history[start:upto]]
+            overflow = len(lines) - self.max_summary_lines
+            if overflow > 0:
+                lines, first = lines[overflow:], first + overflow
+            state.lines, state.first, state.turns = lines, first, upto
+            state.digest = self._digest(history[:upto])
+            return first, list(lines)
+
+    @staticmethod
+    def _digest(turns: List[Dict]) -> str:
+        hasher = hashlib.sha1()
+        for turn in turns:
+            hasher.update(format_turn(turn).encode("utf-8"))
+            hasher.update(b"\0")
+        return hasher.hexdigest()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "token_budget": self.token_budget,
+            "sessions": len(self._sessions),
+            "compactions": self.compactions,
+            "incremental_updates": self.incremental_updates,
+        }
@@ -0,0 +1,266 @@
+import hashlib
+import os
+import shutil
+import uuid
+from typing import IO, TYPE_CHECKING, Any, Dict, Iterator, List, Optional
+
+# pandas, pyarrow and openpyxl are imported on first use to keep startup fast
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+
+CHUNK_ROWS = 50_000
+COPY_BUFFER_BYTES = 1024 * 1024
+PREVIEW_ROWS = 20
+
+FORMATS = {
+    ".csv": "csv",
+    ".tsv": "tsv",
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+    ".xlsx": "xlsx",
+}
+
+
+class IngestError(ValueError):
+    pass
+
+
+class UploadTooLarge(IngestError):
+    pass
+
+
+def detect_format(filename: Optional[str]) -> str:
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension not in FORMATS:
+        raise IngestError(f"Unsupported file type {extension or '(none)'}; expected one of {', '.join(sorted(FORMATS))}")
+    return FORMATS[extension]
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise IngestError("File ingestion requires pyarrow (pip install pyarrow)")
+
+
+def iter_chunks(path: str, fmt: str, chunk_rows: int = CHUNK_ROWS) -> Iterator["pd.DataFrame"]:
+    """Parse an uploaded file into DataFrames of at most `chunk_rows` rows"""
+    import pandas as pd
+
+    if fmt in ("csv", "tsv"):
+        yield from pd.read_csv(path, sep="\t" if fmt == "tsv" else ",", chunksize=chunk_rows)
+    elif fmt == "jsonl":
+        yield from pd.read_json(path, lines=True, chunksize=chunk_rows)
+    elif fmt == "xlsx":
+        yield from _iter_xlsx(path, chunk_rows)
+    else:
+        raise IngestError(f"Unsupported format: {fmt}")
+
+
+def _iter_xlsx(path: str, chunk_rows: int) -> Iterator["pd.DataFrame"]:
+    """First worksheet, first row as header, streamed with openpyxl's read-only mode"""
+    import pandas as pd
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise IngestError("XLSX ingestion requires openpyxl (pip install openpyxl)")
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        names = [str(name) if name is not None else f"Column_{i}" for i, name in enumerate(header)]
+        batch = []
+        for row in rows:
+            batch.append(row[:len(names)])
+            if len(batch) >= chunk_rows:
+                yield pd.DataFrame(batch, columns=names)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=names)
+    finally:
+        workbook.close()
+
+
+def _normalize_mixed(chunk: "pd.DataFrame") -> "pd.DataFrame":
+    """Make object columns that mix value types convertible to Arrow.
+
+    Spreadsheet columns often hold numbers plus the odd note ("N/A"), which
+    Arrow rejects. As for inline sheets, a column whose values all parse as
+    numbers becomes numeric; otherwise its values become strings. Nested JSON
+    values (objects, lists) are left for Arrow to store as structs and lists.
+    """
+    import pandas as pd
+
+    for name in chunk.columns[chunk.dtypes == object]:
+        values = chunk[name]
+        present = values.dropna()
+        kinds = set(present.map(type).unique())
+        if len(kinds) < 2 or kinds & {dict, list}:
+            continue
+        try:
+            converted = pd.to_numeric(values, errors="coerce")
+        except (TypeError, ValueError):
+            converted = None
+        if converted is not None and converted.notna().sum() == len(present):
+            chunk[name] = converted
+        else:
+            chunk[name] = values.where(values.isna(), values.astype(str))
+    return chunk
+
+
+def _widen(current: "pa.DataType", new: "pa.DataType") -> "pa.DataType":
+    """Smallest type both chunks' values fit: nulls take the other type, mixed numbers become
+    float64, anything else mixed becomes string"""
+    import pyarrow as pa
+
+    if current.equals(new) or pa.types.is_null(new):
+        return current
+    if pa.types.is_null(current):
+        return new
+    numeric = (pa.types.is_integer, pa.types.is_floating, pa.types.is_boolean)
+    if any(check(current) for check in numeric) and any(check(new) for check in numeric):
+        return pa.float64()
+    return pa.string()
+
+
+def _conform(table: "pa.Table", schema: "pa.Schema") -> "pa.Table":
+    """Cast a chunk to the final schema, adding columns it never had as nulls"""
+    import pyarrow as pa
+
+    arrays = []
+    for field in schema:
+        if field.name in table.column_names:
+            column = table.column(field.name)
+            arrays.append(column if column.type.equals(field.type) else column.cast(field.type))
+        else:
+            arrays.append(pa.nulls(table.num_rows, field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+class IngestedSheet:
+    """A sheet stored as an uncompressed Arrow IPC file and read back memory-mapped.
+
+    Column buffers of the table are views of the mapped file, so rows are
+    paged in by the OS as columns are read rather than copied onto the heap.
+    """
+
+    def __init__(self, path: str, columns: List[str], row_count: int, preview: List[List[Any]], fingerprint: str):
+        self.path = path
+        self.columns = columns
+        self.row_count = row_count
+        self.preview = preview
+        self.fingerprint = fingerprint
+
+    @property
+    def directory(self) -> str:
+        return os.path.dirname(self.path)
+
+    def table(self) -> "pa.Table":
+        import pyarrow as pa
+        with pa.memory_map(self.path, "r") as source:
+            return pa.ipc.open_file(source).read_all()
+
+
+class SheetStore:
+    """Streams uploaded CSV/TSV/JSON-lines/XLSX files into per-sheet Arrow IPC files.
+
+    The upload is copied to disk in fixed-size blocks (hashing it on the way),
+    parsed in chunks of `chunk_rows` rows and written one Parquet part per
+    chunk. Columns whose inferred type differs between chunks are widened,
+    then the parts are merged into a single uncompressed Arrow IPC file,
+    which unlike Parquet can be memory-mapped without decoding. Memory use is
+    bounded by one chunk, whatever the file size.
+    """
+
+    def __init__(self, root: str, chunk_rows: int = CHUNK_ROWS, max_bytes: int = 512 * 1024 * 1024):
+        self.root = root
+        self.chunk_rows = chunk_rows
+        self.max_bytes = max_bytes
+        self.ingested = 0
+        self.ingested_rows = 0
+        os.makedirs(root, exist_ok=True)
+
+    def ingest(self, source: IO[bytes], filename: str) -> IngestedSheet:
+        fmt = detect_format(filename)
+        _require_pyarrow()
+        directory = os.path.join(self.root, uuid.uuid4().hex)
+        os.makedirs(directory)
+        try:
+            raw_path = os.path.join(directory, "upload" + os.path.splitext(filename)[1].lower())
+            fingerprint = self._copy(source, raw_path)
+            sheet = self._convert(raw_path, fmt, directory, fingerprint)
+            os.remove(raw_path)
+        except Exception:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        self.ingested += 1
+        self.ingested_rows += sheet.row_count
+        return sheet
+
+    def _copy(self, source: IO[bytes], path: str) -> str:
+        hasher = hashlib.sha256()
+        size = 0
+        with open(path, "wb") as out:
+            while True:
+                block = source.read(COPY_BUFFER_BYTES)
+                if not block:
+                    break
+                size += len(block)
+                if size > self.max_bytes:
+                    raise UploadTooLarge(f"File is larger than the {self.max_bytes:,} byte limit")
+                hasher.update(block)
+                out.write(block)
+        return "file:" + hasher.hexdigest()
+
+    def _convert(self, raw_path: str, fmt: str, directory: str, fingerprint: str) -> IngestedSheet:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        parts = []
+        types: Dict[str, "pa.DataType"] = {}
+        preview: List[List[Any]] = []
+        row_count = 0
+
+        for chunk in iter_chunks(raw_path, fmt, self.chunk_rows):
+            chunk.columns = [str(name) for name in chunk.columns]
+            if not preview:
+                sample = chunk.head(PREVIEW_ROWS).astype(object)
+                preview = sample.where(sample.notna(), None).values.tolist()
+            table = pa.Table.from_pandas(_normalize_mixed(chunk), preserve_index=False)
+            for field in table.schema:
+                types[field.name] = _widen(types[field.name], field.type) if field.name in types else field.type
+
+            part_path = os.path.join(directory, f"part-{len(parts):05d}.parquet")
+            pq.write_table(table, part_path)
+            parts.append(part_path)
+            row_count += table.num_rows
+
+        if not types:
+            raise IngestError("File has no columns")
+
+        schema = pa.schema([pa.field(name, pa.string() if pa.types.is_null(kind) else kind) for name, kind in types.items()])
+        path = os.path.join(directory, "sheet.arrow")
+        with pa.ipc.new_file(path, schema) as writer:
+            for part_path in parts:
+                writer.write_table(_conform(pq.read_table(part_path), schema))
+                os.remove(part_path)
+
+        return IngestedSheet(path, list(types), row_count, preview, fingerprint)
+
+    def remove(self, directory: str):
+        """Delete a sheet's files; only directories under the store root are touched"""
+        if os.path.dirname(os.path.abspath(directory)) == os.path.abspath(self.root):
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "root": self.root,
+            "ingested": self.ingested,
+            "ingested_rows": self.ingested_rows,
+            "chunk_rows": self.chunk_rows,
+        }
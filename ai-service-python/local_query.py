@@ -0,0 +1,289 @@
+import re
+from typing import TYPE_CHECKING, Any, List, Optional, Tuple, Union
+
+from sheets import is_arrow_table
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+
+# Words that signal a question needs reasoning (filters, comparisons, advice)
+# beyond a single aggregation; those always go to Gemini
+UNSUPPORTED = re.compile(
+    r"\b(why|where|when|which|trend|trends|predict|forecast|recommend|suggest|compare|correlat\w*|"
+    r"between|than|over|under|above|below|after|before|last|next|except|without|if|explain)\b"
+)
+
+OPERATIONS = [
+    ("mean", re.compile(r"\b(average|avg|mean)\b")),
+    ("sum", re.compile(r"\b(total|sum)\b")),
+    ("max", re.compile(r"\b(max|maximum|highest|largest|biggest)\b")),
+    ("min", re.compile(r"\b(min|minimum|lowest|smallest)\b")),
+    ("top", re.compile(r"\b(top|most common|most frequent)\b")),
+    ("count", re.compile(r"\b(count|how many|number of)\b")),
+]
+
+OPERATION_LABELS = {"mean": "Average", "sum": "Total", "max": "Maximum", "min": "Minimum"}
+
+GROUP_BY = re.compile(r"\b(?:by|per|for each|across|grouped by)\s+(.+)$")
+GROUP_WORDS = re.compile(r"\b(by|per|for each|across|grouped by)\b")
+TOP_K = re.compile(r"\btop\s+(\d+)\b")
+DISTINCT = re.compile(r"\b(unique|distinct|different)\b")
+
+MAX_ROWS = 20
+
+
+def _singular(token: str) -> str:
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens, splitting camelCase/snake_case and dropping plurals"""
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", str(text))
+    return [_singular(token) for token in re.findall(r"[a-z0-9]+", text.lower())]
+
+
+# Words that frame a question without changing what it asks; any other word the
+# operation and columns do not account for (a filter like "oil changes" or a
+# value like "Golf" or "200") means the question is not a plain aggregation
+FILLER = {_singular(word) for word in (
+    "what", "whats", "s", "is", "are", "was", "were", "the", "a", "an", "of", "in", "on", "for", "to", "with",
+    "me", "show", "tell", "give", "please", "can", "could", "would", "you", "i", "we", "my", "our", "us",
+    "do", "does", "have", "has", "there", "it", "its", "this", "that", "these", "those", "and", "all",
+    "each", "every", "overall", "whole", "entire", "sheet", "data", "dataset", "table", "column", "field",
+    "value", "list", "find", "get", "calculate", "compute", "see", "know", "want", "like", "about",
+)}
+ROW_WORDS = {"row", "record", "entry"}
+
+
+def _is_numeric(series) -> bool:
+    from pandas.api.types import is_numeric_dtype
+    return is_numeric_dtype(series)
+
+
+def _fmt(value) -> str:
+    if isinstance(value, (int,)) or (isinstance(value, float) and value.is_integer()):
+        return f"{int(value):,}"
+    if isinstance(value, float):
+        return f"{value:,.2f}"
+    return str(value)
+
+
+class _FrameColumns:
+    """Column operations on a pandas DataFrame"""
+
+    def __init__(self, df: "pd.DataFrame"):
+        self.df = df
+        self.names = list(df.columns)
+        self.rows = len(df)
+
+    def is_numeric(self, name: str) -> bool:
+        return _is_numeric(self.df[name])
+
+    def aggregate(self, name: str, operation: str) -> Tuple[float, int]:
+        """The aggregate and the number of values it covers"""
+        return float(self.df[name].agg(operation)), int(self.df[name].count())
+
+    def grouped(self, group: str, metric: str, operation: str, limit: int) -> Tuple[List[Tuple[Any, Any]], int]:
+        """The first `limit` groups by aggregate, largest first, and the number of groups"""
+        series = self.df.groupby(group, dropna=True)[metric].agg(operation).sort_values(ascending=False)
+        return list(series.head(limit).items()), len(series)
+
+    def value_counts(self, name: str, limit: int) -> Tuple[List[Tuple[Any, Any]], int]:
+        series = self.df[name].value_counts(dropna=True)
+        return list(series.head(limit).items()), len(series)
+
+    def distinct(self, name: str) -> int:
+        return int(self.df[name].nunique(dropna=True))
+
+
+class _TableColumns:
+    """The same operations on a pyarrow Table with pyarrow.compute, reading only the columns involved"""
+
+    def __init__(self, table: "pa.Table"):
+        self.table = table
+        self.names = table.column_names
+        self.rows = table.num_rows
+
+    def is_numeric(self, name: str) -> bool:
+        import pyarrow as pa
+        kind = self.table.schema.field(name).type
+        return pa.types.is_integer(kind) or pa.types.is_floating(kind) or pa.types.is_boolean(kind)
+
+    def aggregate(self, name: str, operation: str) -> Tuple[float, int]:
+        import pyarrow.compute as pc
+        values = self.table.column(name)
+        value = getattr(pc, operation)(values).as_py()
+        return float("nan") if value is None else float(value), len(values) - values.null_count
+
+    def grouped(self, group: str, metric: str, operation: str, limit: int) -> Tuple[List[Tuple[Any, Any]], int]:
+        import pyarrow.compute as pc
+        table = self.table.select([group, metric])
+        table = table.filter(pc.is_valid(table.column(group)))
+        result = table.group_by(group).aggregate([(metric, operation)])
+        value_name = f"{metric}_{operation}"
+        top = result.sort_by([(value_name, "descending")]).slice(0, limit)
+        return list(zip(top.column(group).to_pylist(), top.column(value_name).to_pylist())), result.num_rows
+
+    def value_counts(self, name: str, limit: int) -> Tuple[List[Tuple[Any, Any]], int]:
+        import pyarrow.compute as pc
+        counts = pc.value_counts(pc.drop_null(self.table.column(name)))
+        top = counts.take(pc.array_sort_indices(counts.field("counts"), order="descending")[:limit])
+        return list(zip(top.field("values").to_pylist(), top.field("counts").to_pylist())), len(counts)
+
+    def distinct(self, name: str) -> int:
+        import pyarrow.compute as pc
+        return pc.count_distinct(self.table.column(name), mode="only_valid").as_py()
+
+
+def _columns(data):
+    return _TableColumns(data) if is_arrow_table(data) else _FrameColumns(data)
+
+
+class LocalQueryEngine:
+    """Answers simple aggregation questions directly from the sheet's rows.
+
+    Recognizes average/total/min/max of a numeric column (optionally "by"
+    another column), counts, and top-k values. Anything else returns None so
+    the caller falls back to Gemini, including questions with words the
+    aggregation does not account for, since those are usually filters
+    ("average cost of oil changes", "total cost for Golf"). The rows are a
+    pandas DataFrame, or a pyarrow Table for uploaded files.
+    """
+
+    def accepts(self, question: str) -> bool:
+        """Whether the question could be a plain aggregation, checked before any rows are built"""
+        return self._parse(question) is not None
+
+    def answer(self, question: str, data: Union["pd.DataFrame", "pa.Table"], row_count: Optional[int] = None) -> Optional[str]:
+        """The answer, or None for the caller to ask Gemini. `row_count` is the sheet's
+        size when `data` may hold only some of its rows; answers over a partial sheet
+        would be wrong, so those fall back too."""
+        parsed = self._parse(question)
+        if parsed is None or data is None:
+            return None
+        columns = _columns(data)
+        if not columns.rows or (row_count is not None and row_count != columns.rows):
+            return None
+
+        text, operation, operation_pattern = parsed
+        full_text = text
+
+        group_column = None
+        group_match = GROUP_BY.search(text)
+        if group_match:
+            group_column = self._match_column(group_match.group(1), columns.names)
+            if group_column is None:
+                return None
+            text = text[:group_match.start()]
+
+        mentioned = [col for col in self._mentioned_columns(text, columns.names) if col != group_column]
+        numeric = [col for col in mentioned if columns.is_numeric(col)]
+        if self._unexplained(full_text, operation_pattern, [*mentioned, group_column] if group_column else mentioned):
+            return None
+
+        try:
+            if operation in OPERATION_LABELS:
+                if len(numeric) != 1:
+                    return None
+                return self._aggregate(columns, operation, numeric[0], group_column)
+            if operation == "top":
+                return self._top(columns, text, mentioned, numeric, group_column)
+            return self._count(columns, text, mentioned, group_column)
+        except (TypeError, ValueError, NotImplementedError):
+            return None
+
+    def _parse(self, question: str):
+        """The normalized question, its operation and the operation's pattern, or None"""
+        text = question.lower().strip().rstrip("?!. ")
+        if UNSUPPORTED.search(text):
+            return None
+        return next(((text, name, pattern) for name, pattern in OPERATIONS if pattern.search(text)), None)
+
+    def _aggregate(self, columns, operation, metric, group_column) -> str:
+        label = OPERATION_LABELS[operation]
+        if group_column is None:
+            value, count = columns.aggregate(metric, operation)
+            return f"📊 {label} {metric}: **{_fmt(value)}** (over {count:,} rows)"
+
+        groups, total = columns.grouped(group_column, metric, operation, MAX_ROWS)
+        return self._table(f"📊 {label} {metric} by {group_column}", groups, total)
+
+    def _top(self, columns, text, mentioned, numeric, group_column) -> Optional[str]:
+        k_match = TOP_K.search(text)
+        k = int(k_match.group(1)) if k_match else 5
+        k = max(1, min(k, MAX_ROWS))
+
+        categorical = [col for col in mentioned if col not in numeric]
+        if group_column is not None:
+            # "top 5 dealers by revenue": the "by" column is the metric to rank on
+            if len(categorical) != 1 or numeric or not columns.is_numeric(group_column):
+                return None
+            ranked, _ = columns.grouped(categorical[0], group_column, "sum", k)
+            return self._table(f"📊 Top {len(ranked)} {categorical[0]} by total {group_column}", ranked, len(ranked))
+
+        if len(categorical) != 1:
+            return None
+        counts, _ = columns.value_counts(categorical[0], k)
+        return self._table(f"📊 Top {len(counts)} {categorical[0]} values", counts, len(counts))
+
+    def _count(self, columns, text, mentioned, group_column) -> Optional[str]:
+        if group_column is not None:
+            counts, total = columns.value_counts(group_column, MAX_ROWS)
+            return self._table(f"📊 Row count by {group_column}", counts, total)
+        if not mentioned:
+            # Only "how many rows/records", not "how many vehicles" on a sheet that may list something else
+            if not ROW_WORDS & set(tokenize(text)):
+                return None
+            return f"📊 The sheet has **{columns.rows:,}** rows."
+        if len(mentioned) != 1:
+            return None
+        column = mentioned[0]
+        if DISTINCT.search(text) or "how many" in text:
+            return f"📊 {column} has **{columns.distinct(column):,}** distinct values."
+        counts, total = columns.value_counts(column, MAX_ROWS)
+        return self._table(f"📊 Count of each {column}", counts, total)
+
+    def _unexplained(self, text: str, operation_pattern, columns: List[str]) -> List[str]:
+        """Words of the question not covered by the operation, the columns, the grouping or filler"""
+        for pattern in (TOP_K, operation_pattern, DISTINCT, GROUP_WORDS):
+            text = pattern.sub(" ", text)
+        known = FILLER | ROW_WORDS
+        for column in columns:
+            known.update(tokenize(column))
+        return [token for token in tokenize(text) if token not in known]
+
+    def _table(self, title: str, rows: List[Tuple[Any, Any]], total: int) -> str:
+        """Bulleted label/value lines, noting how many of `total` were left out"""
+        shown = rows[:MAX_ROWS]
+        lines = [f"{title}:"]
+        lines += [f"- {label}: {_fmt(float(value))}" for label, value in shown]
+        if total > len(shown):
+            lines.append(f"- ... and {total - len(shown):,} more")
+        return "\n".join(lines)
+
+    def _match_column(self, phrase: str, columns) -> Optional[str]:
+        matches = self._mentioned_columns(phrase, columns)
+        return matches[0] if len(matches) == 1 else None
+
+    def _mentioned_columns(self, text: str, columns) -> List[str]:
+        """Columns whose name tokens all appear in the text, longest names first"""
+        words = set(tokenize(text))
+        found = []
+        for column in columns:
+            tokens = tokenize(column)
+            if tokens and all(token in words for token in tokens):
+                found.append((len(tokens), column))
+        found.sort(key=lambda item: -item[0])
+
+        # Drop columns whose name is contained in a longer matched name ("Type" vs "ServiceType")
+        selected = []
+        for _, column in found:
+            tokens = set(tokenize(column))
+            if not any(tokens < set(tokenize(other)) for other in selected):
+                selected.append(column)
+        return selected
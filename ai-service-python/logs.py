@@ -0,0 +1,154 @@
+import json
+import logging
+import queue
+import random
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+REQUEST_ID_HEADER = "x-request-id"
+
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+_sampled: ContextVar[bool] = ContextVar("log_sampled", default=True)
+
+# Attributes every LogRecord has; anything else on a record came from `extra=` and is logged as a field.
+# color_message is uvicorn's ANSI-coloured copy of its message.
+_RECORD_ATTRIBUTES = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime", "taskName", "color_message"}
+
+
+def should_log(logger: logging.Logger, level: int = logging.INFO) -> bool:
+    """Whether a record would be kept, checked before building it; guards hot-path log calls"""
+    return logger.isEnabledFor(level) and (level >= logging.WARNING or _sampled.get())
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message, request ID and any `extra=` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and key != "request_id":
+                entry.setdefault(key, value)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RequestContextFilter(logging.Filter):
+    """Tags records with the current request ID and drops sub-warning records of unsampled requests.
+
+    Runs in the thread that logs, before the record is queued, so the
+    contextvars it reads are the request's own.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        return record.levelno >= logging.WARNING or _sampled.get()
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """Queues records for the listener thread without formatting them first, and drops them when full"""
+
+    def __init__(self, log_queue: "queue.Queue"):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The queue stays in this process, so the record can be formatted on the
+        # listener thread as-is; QueueHandler's default formats it here instead
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogSettings:
+    """Root logging through a background queue: JSON to stderr, with a level and a per-request sample rate"""
+
+    def __init__(self, level: str = "INFO", sample_rate: float = 1.0, queue_size: int = 10000):
+        self.sample_rate = sample_rate
+        self.queue_handler = BackgroundQueueHandler(queue.Queue(maxsize=queue_size))
+        self.queue_handler.addFilter(RequestContextFilter())
+        output = logging.StreamHandler()
+        output.setFormatter(JsonFormatter())
+        self.listener = QueueListener(self.queue_handler.queue, output)
+        self.running = False
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.queue_handler)
+        self.set_level(level)
+
+    @property
+    def level(self) -> str:
+        return logging.getLevelName(logging.getLogger().level)
+
+    def set_level(self, level: str):
+        logging.getLogger().setLevel(level.upper())
+
+    def start(self):
+        if not self.running:
+            self.listener.start()
+            self.running = True
+
+    def stop(self):
+        """Flush queued records and stop the listener thread"""
+        if self.running:
+            self.listener.stop()
+            self.running = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "level": self.level,
+            "sample_rate": self.sample_rate,
+            "queued": self.queue_handler.queue.qsize(),
+            "dropped": self.queue_handler.dropped,
+        }
+
+
+class RequestContextMiddleware:
+    """ASGI middleware giving each HTTP request an ID (from X-Request-ID or new) and a log sampling decision"""
+
+    def __init__(self, app, settings: LogSettings):
+        self.app = app
+        self.settings = settings
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == REQUEST_ID_HEADER.encode():
+                request_id = value.decode("latin-1")[:128]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        sample_rate = self.settings.sample_rate
+        id_token = _request_id.set(request_id)
+        sampled_token = _sampled.set(sample_rate >= 1 or random.random() < sample_rate)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (REQUEST_ID_HEADER.encode(), request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _request_id.reset(id_token)
+            _sampled.reset(sampled_token)
@@ -1,20 +1,53 @@
-from fastapi import FastAPI, HTTPException
+import time
+# Taken before anything else is imported so import_seconds on /health covers the whole module
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, File, Form, Header, HTTPException, Query, Request, Response, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, PrivateAttr
 from dotenv import load_dotenv
 import os
-import google.generativeai as genai
-from typing import List, Optional, Dict, Any
+import asyncio
+import threading
+from typing import List, Optional, Dict, Any, Literal, Tuple
 import json
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import io
 import base64
+import hmac
+import logging
+import math
+import re
+import tempfile
 from datetime import datetime
+from concurrency import BoundedExecutor, SingleFlight
+from providers import create_provider
+from routing import ModelRouter, ModelTier
+from resilience import CircuitBreaker, RateLimiter, UpstreamGuard, UpstreamUnavailable
+from cache import ResponseCache, create_backend
+from sheets import SheetError, SheetRegistry, build_frame, sheet_fingerprint
+from ingest import IngestError, IngestedSheet, SheetStore, UploadTooLarge
+from stats import summarize_frame, summarize_table, format_stats_for_prompt
+from local_query import LocalQueryEngine
+from classifier import DataTypeClassifier
+from prompts import PromptRegistry, column_key
+from history import HistoryManager, estimate_tokens
+from charts import ChartCache, ChartRenderer, chart_cache_key, chart_spec, vega_lite_spec
+from metrics import CONTENT_TYPE, MetricsMiddleware, ServiceMetrics
+from profiling import FORMATS as PROFILE_FORMATS, RequestProfiler
+from logs import LogSettings, RequestContextMiddleware, should_log
+from semantic_cache import SemanticCache, SimilarAnswer, jaccard, normalize
 
 load_dotenv()
 
+# JSON logs written by a background thread; below WARNING, only a LOG_SAMPLE_RATE share of requests log
+log_settings = LogSettings(
+    level=os.getenv("LOG_LEVEL", "INFO"),
+    sample_rate=float(os.getenv("LOG_SAMPLE_RATE", 1.0)),
+    queue_size=int(os.getenv("LOG_QUEUE_SIZE", 10000))
+)
+log_settings.start()
+logger = logging.getLogger("provolx")
+
 app = FastAPI(title="Provolx AI Assistant - Gemini Powered")
 
 # CORS
@@ -31,13 +64,118 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize Gemini AI
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY environment variable is required")
+# Per-stage timings, HTTP latency and chat counters, exported on /metrics
+service_metrics = ServiceMetrics()
+app.add_middleware(MetricsMiddleware, metrics=service_metrics)
+# Outermost, so every log line of a request (including the access log) carries its ID
+app.add_middleware(RequestContextMiddleware, settings=log_settings)
+
+# Admin endpoints (/admin/*) are disabled unless a token is configured
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Opt-in /chat profiling: requests with `X-Profile: <ADMIN_TOKEN>`, or a sampled share of all requests
+request_profiler = RequestProfiler(
+    sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", 0)),
+    token=ADMIN_TOKEN,
+    interval=float(os.getenv("PROFILE_INTERVAL_MS", 1)) / 1000,
+    max_profiles=int(os.getenv("PROFILE_MAX_STORED", 20))
+)
+
+# Model backend: Gemini, or a deterministic local stub for load testing without network access
+MODEL_PROVIDER = os.getenv("MODEL_PROVIDER", "gemini")
+PROVIDER_OPTIONS = dict(
+    api_key=os.getenv("GEMINI_API_KEY"),
+    # Point at another Gemini-compatible REST endpoint, e.g. http://localhost:8090 for fake_gemini.py
+    api_endpoint=os.getenv("GEMINI_API_ENDPOINT"),
+    latency=float(os.getenv("STUB_LATENCY_MS", 0)) / 1000,
+    response_chars=int(os.getenv("STUB_RESPONSE_CHARS", 600)),
+    chunk_chars=int(os.getenv("STUB_CHUNK_CHARS", 80))
+)
+model_provider = create_provider(MODEL_PROVIDER, model_name=os.getenv("GEMINI_MODEL"), **PROVIDER_OPTIONS)
+
+def optional_tier(name: str, model_env: str) -> Optional[ModelTier]:
+    """A routing tier for the model named in `model_env`, if one is configured"""
+    model_name = os.getenv(model_env)
+    if not model_name:
+        return None
+    provider = create_provider(MODEL_PROVIDER, model_name=model_name, **PROVIDER_OPTIONS)
+    return ModelTier(name, provider, cost_per_1k_tokens=float(os.getenv(f"{model_env}_COST_PER_1K", 0)))
+
+# Trivial turns go to a light model and long or analytical ones to a heavy model, when configured
+model_router = ModelRouter(
+    ModelTier("standard", model_provider, cost_per_1k_tokens=float(os.getenv("GEMINI_MODEL_COST_PER_1K", 0))),
+    light=optional_tier("light", "GEMINI_LIGHT_MODEL"),
+    heavy=optional_tier("heavy", "GEMINI_HEAVY_MODEL"),
+    light_max_tokens=int(os.getenv("ROUTER_LIGHT_MAX_TOKENS", 1500)),
+    heavy_min_tokens=int(os.getenv("ROUTER_HEAVY_MIN_TOKENS", 12000))
+)
+
+# Seconds from the start of the main module import; warmup runs in the background after startup
+startup_times: Dict[str, Optional[float]] = {"import_seconds": None, "ready_seconds": None, "warmup_seconds": None}
 
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-2.0-flash-exp')
+# Model calls are blocking, so they run on a bounded thread pool
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", 8))
+generation_executor = BoundedExecutor(GEMINI_MAX_CONCURRENCY, name="gemini")
+# Identical prompts arriving together (dashboard fan-out) share one Gemini call
+generation_flight = SingleFlight()
+
+# Stay under the Gemini quota, retry transient errors, and fail fast while Gemini is down
+gemini_guard = UpstreamGuard(
+    RateLimiter(rpm=float(os.getenv("GEMINI_RPM", 0)), tpm=float(os.getenv("GEMINI_TPM", 0))),
+    CircuitBreaker(
+        failure_threshold=int(os.getenv("GEMINI_BREAKER_THRESHOLD", 5)),
+        reset_timeout=float(os.getenv("GEMINI_BREAKER_RESET_SECONDS", 30))
+    ),
+    max_retries=int(os.getenv("GEMINI_MAX_RETRIES", 3)),
+    base_delay=float(os.getenv("GEMINI_RETRY_BASE_DELAY", 0.5)),
+    max_delay=float(os.getenv("GEMINI_RETRY_MAX_DELAY", 8))
+)
+
+# /chat/batch: questions per request, and how many of them are answered at once
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", 100))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", 4))
+
+# Simple aggregations ("average mileage by model") are answered with pandas, skipping Gemini
+LOCAL_QUERY_ENABLED = os.getenv("LOCAL_QUERY_ENABLED", "true").lower() == "true"
+LOCAL_MODEL_NAME = "local-pandas"
+
+# Charts render in worker processes so matplotlib never blocks the event loop
+chart_renderer = ChartRenderer(
+    pool_size=int(os.getenv("CHART_POOL_SIZE", 2)),
+    timeout=float(os.getenv("CHART_RENDER_TIMEOUT", 10))
+)
+CHART_ID_PATTERN = re.compile(r"[0-9a-f]{64}")
+chart_cache = ChartCache(
+    max_bytes=int(os.getenv("CHART_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+    # Always on disk: visualization URLs must outlive the in-memory LRU, restarts
+    # and the worker that rendered them
+    disk_dir=os.getenv("CHART_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "provolx-charts"),
+    disk_max_bytes=int(os.getenv("CHART_CACHE_DISK_MAX_BYTES", 512 * 1024 * 1024))
+)
+
+# Long conversations are compacted so prompts stay bounded (token counts are local estimates)
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", 3000))
+PROMPT_TOKEN_LIMIT = int(os.getenv("PROMPT_TOKEN_LIMIT", 30000))
+PROMPT_OVERHEAD_TOKENS = 64  # section headings and separators around the prompt parts
+
+# Identical prompts (canned dashboard questions) are answered from cache
+response_cache = ResponseCache(
+    create_backend(
+        os.getenv("RESPONSE_CACHE_BACKEND", "memory"),
+        max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1024)),
+        max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+        redis_url=os.getenv("RESPONSE_CACHE_REDIS_URL"),
+    ),
+    ttl=int(os.getenv("RESPONSE_CACHE_TTL", 3600)),
+)
+
+# Reworded repeats of a question about the same sheet reuse the earlier answer ("shadow" only measures)
+semantic_cache = SemanticCache(
+    mode=os.getenv("SEMANTIC_CACHE_MODE", "off").lower(),
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.8)),
+    max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 10000)),
+    ttl=float(os.getenv("SEMANTIC_CACHE_TTL", 3600))
+)
 
 # System prompt for automotive data analysis
 SYSTEM_PROMPT = """You are an intelligent automotive data analysis assistant for Provolx.
@@ -58,6 +196,10 @@ When answering:
 
 Your tone should be professional yet friendly, like a helpful automotive expert."""
 
+# Closing instructions appended to every prompt
+RESPONSE_INSTRUCTIONS = """Please provide a helpful response. If the question involves data analysis that would benefit from visualization, 
+please suggest creating a chart or graph and describe what type of visualization would be most appropriate."""
+
 class Message(BaseModel):
     role: str
     content: str
@@ -65,240 +207,200 @@ class Message(BaseModel):
 class SheetData(BaseModel):
     name: Optional[str] = None
     columns: Optional[List[Dict[str, Any]]] = None
-    dataPreview: Optional[List[Any]]] = None
+    dataPreview: Optional[List[Any]] = None
     rowCount: Optional[int] = None
+    
+    _frame: Any = PrivateAttr(default=None)
+    _table: Any = PrivateAttr(default=None)
+    _stats: Any = PrivateAttr(default=None)
+    _fingerprint: Optional[str] = PrivateAttr(default=None)
+    _data_types: Any = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr(default_factory=threading.RLock)
+    
+    def frame(self):
+        """Typed DataFrame of the JSON rows, built on first use and reused afterwards"""
+        # Threads answering the question and drawing the chart share one build
+        with self._lock:
+            if self._frame is None:
+                self._frame = build_frame(self.columns, self.dataPreview)
+        return self._frame
+    
+    def data(self):
+        """All rows, for statistics, local queries and charts: the memory-mapped Arrow
+        table of an uploaded file, otherwise the DataFrame"""
+        return self._table if self._table is not None else self.frame()
+    
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-column statistics over all rows, computed once"""
+        with self._lock:
+            if self._stats is None:
+                self._stats = summarize_table(self._table) if self._table is not None else summarize_frame(self.frame())
+        return self._stats
+    
+    def nbytes(self) -> int:
+        """Size of the rows: the mapped file's columns for an upload, the DataFrame's deep size otherwise"""
+        if self._table is not None:
+            return self._table.nbytes
+        return int(self.frame().memory_usage(index=True, deep=True).sum())
+    
+    def fingerprint(self) -> str:
+        """Content hash of columns and rows, computed once"""
+        with self._lock:
+            if self._fingerprint is None:
+                self._fingerprint = sheet_fingerprint(self.columns, self.dataPreview)
+        return self._fingerprint
+    
+    def data_types(self, classify) -> List[Tuple[str, float]]:
+        """Ranked (data type, confidence) pairs, classified once so a stored sheet
+        is not reclassified on every turn"""
+        if self._data_types is None:
+            self._data_types = classify(self.columns, self.dataPreview)
+        return self._data_types
+    
+    @classmethod
+    def from_ingested(cls, ingested: IngestedSheet, name: Optional[str] = None) -> "SheetData":
+        """A sheet backed by a columnar file: dataPreview holds only the first rows, while
+        data(), stats() and fingerprint() cover the whole file"""
+        sheet = cls(
+            name=name,
+            columns=[{"name": column} for column in ingested.columns],
+            dataPreview=ingested.preview,
+            rowCount=ingested.row_count
+        )
+        sheet._table = ingested.table()
+        sheet._fingerprint = ingested.fingerprint
+        return sheet
 
 class ChatRequest(BaseModel):
     message: str
     token: str
     sheetData: Optional[SheetData] = None
+    sheetId: Optional[str] = None  # ID from POST /sheets, used instead of inline sheetData
+    sessionId: Optional[str] = None  # Keys the rolling summary of older conversation turns
+    # "url" omits the base64 image from the response; "spec" returns a Vega-Lite spec instead of a PNG
+    visualizationMode: Literal["inline", "url", "spec"] = "inline"
     conversation_history: Optional[List[Message]] = []
 
 class ChatResponse(BaseModel):
     answer: str
     model: str
     timestamp: str
-    visualization: Optional[str] = None  # Base64 encoded image
+    visualization: Optional[str] = None  # Base64 encoded image (visualizationMode "inline" only)
+    visualizationId: Optional[str] = None
+    visualizationUrl: Optional[str] = None  # GET this for the raw PNG
+    visualizationSpec: Optional[Dict[str, Any]] = None  # Vega-Lite spec with aggregated data (visualizationMode "spec")
+    cached: bool = False  # True when answered from the response or semantic cache
+    source: str = "gemini"  # Which path answered: "gemini", "cache", "semantic" or "local"
+
+class LoggingUpdate(BaseModel):
+    level: Optional[Literal["DEBUG", "INFO", "WARNING", "ERROR"]] = None
+    sampleRate: Optional[float] = None  # share of requests whose sub-WARNING records are logged
+
+class BatchChatRequest(BaseModel):
+    questions: List[str]
+    token: str
+    sheetData: Optional[SheetData] = None
+    sheetId: Optional[str] = None  # ID from POST /sheets, used instead of inline sheetData
+
+class BatchChatItem(BaseModel):
+    index: int
+    question: str
+    answer: Optional[str] = None
+    model: Optional[str] = None
+    source: Optional[str] = None
+    cached: bool = False
+    elapsedMs: float
+    error: Optional[str] = None  # Set instead of answer when this question failed
+
+class BatchChatResponse(BaseModel):
+    results: List[BatchChatItem]  # In the same order as the questions
+    dataType: Optional[str] = None
+    elapsedMs: float
+    timestamp: str
 
 class GeminiAIEngine:
     def __init__(self):
         self.system_prompt = SYSTEM_PROMPT
+        self.local_query = LocalQueryEngine()
+        self.classifier = DataTypeClassifier()
+        self.prompts = PromptRegistry()
+        self.history = HistoryManager(token_budget=HISTORY_TOKEN_BUDGET)
         
     def detect_data_type(self, columns, data_preview):
         """Detect the type of data in the sheet based on column names and sample data"""
-        if not columns:
-            return "General Data"
-        
-        column_names = [col.get('name', '').lower() for col in columns]
-        column_names_str = ' '.join(column_names).lower()
-        
-        # Sample data values for additional context
-        sample_text = ''
-        if data_preview and len(data_preview) > 0:
-            sample_text = str(data_preview[0]).lower()
-        
-        combined_context = (column_names_str + ' ' + sample_text).lower()
-        
-        # Automotive/Vehicle specific data types
-        if any(keyword in combined_context for keyword in [
-            'vehicle', 'car', 'model', 'make', 'year', 'mileage', 'vin', 
-            'engine', 'transmission', 'fuel', 'maintenance', 'service'
-        ]):
-            return "Automotive/Vehicle"
-        
-        # Service Records
-        if any(keyword in combined_context for keyword in [
-            'service', 'appointment', 'booking', 'technician', 'repair', 
-            'diagnosis', 'labor', 'parts', 'cost', 'invoice'
-        ]):
-            return "Service Records"
-        
-        # Customer Data
-        if any(keyword in combined_context for keyword in [
-            'customer', 'client', 'name', 'phone', 'email', 'address', 
-            'loyalty', 'feedback', 'satisfaction', 'complaint'
-        ]):
-            return "Customer Data"
-        
-        # Sales Data
-        if any(keyword in combined_context for keyword in [
-            'sale', 'purchase', 'price', 'dealer', 'salesperson', 
-            'transaction', 'payment', 'financing'
-        ]):
-            return "Sales Data"
-        
-        # Inventory Data
-        if any(keyword in combined_context for keyword in [
-            'inventory', 'stock', 'parts', 'sku', 'quantity', 
-            'supplier', 'warehouse', 'location'
-        ]):
-            return "Inventory Data"
-        
-        return "General Data"
+        return self.classify_data_type(columns, data_preview)[0][0]
+    
+    def classify_data_type(self, columns, data_preview):
+        """Rank every data type with a confidence score, best match first"""
+        return self.classifier.rank(columns, data_preview)
     
     def get_context_aware_prompt(self, data_type, columns, name):
         """Generate context-aware prompt based on detected data type"""
-        column_names = [col.get('name', '') for col in columns] if columns else []
-        
-        if data_type == "Automotive/Vehicle":
-            return f"""You are an intelligent automotive data assistant for Provolx.
-You're analyzing {name or 'vehicle data'} which contains AUTOMOTIVE/VEHICLE DATA.
-
-Adapt your responses to automotive context:
-- Use automotive terminology (mileage, service intervals, maintenance schedules)
-- Focus on vehicle performance, maintenance needs, reliability metrics
-- Calculate average mileage, service frequency, common issues
-- Identify vehicles needing service, maintenance patterns, warranty status
-- Analyze vehicle performance trends and service history
-- Use a professional, automotive-focused tone
-
-Example questions you should handle naturally:
-- "Show me vehicles due for service"
-- "Calculate average mileage by model"
-- "Identify common maintenance issues"
-- "Show warranty expiration dates"
-- "List vehicles with high mileage"
-- "What's the service frequency?"
-
-Available columns: {', '.join(column_names) if column_names else 'None provided'}
-Always use specific data from these columns to answer questions."""
-        
-        elif data_type == "Service Records":
-            return f"""You are an intelligent service records assistant for Provolx.
-You're analyzing {name or 'service records'} which contains SERVICE RECORDS DATA.
-
-Adapt your responses to service context:
-- Use service terminology (appointments, repairs, diagnostics, labor)
-- Focus on service performance, technician efficiency, customer satisfaction
-- Calculate average service time, repair costs, completion rates
-- Identify common repairs, technician performance, parts usage
-- Analyze service trends, seasonal patterns, customer feedback
-- Use a professional, service-focused tone
-
-Example questions you should handle naturally:
-- "Show me service summary"
-- "Calculate average repair time"
-- "What are the common repairs?"
-- "Show technician performance"
-- "List high-cost services"
-- "What's the customer satisfaction rate?"
-
-Available columns: {', '.join(column_names) if column_names else 'None provided'}
-Always use specific data from these columns to answer questions."""
-        
-        elif data_type == "Customer Data":
-            return f"""You are an intelligent customer data assistant for Provolx.
-You're analyzing {name or 'customer data'} which contains CUSTOMER DATA.
-
-Adapt your responses to customer context:
-- Use customer terminology (loyalty, satisfaction, feedback, complaints)
-- Focus on customer behavior, satisfaction levels, retention rates
-- Calculate customer lifetime value, satisfaction scores, feedback trends
-- Identify loyal customers, at-risk customers, feedback patterns
-- Analyze customer demographics, preferences, service history
-- Use a friendly, customer-focused tone
-
-Example questions you should handle naturally:
-- "Show me customer satisfaction scores"
-- "Calculate customer retention rate"
-- "Identify loyal customers"
-- "Show feedback trends"
-- "List at-risk customers"
-- "What are common complaints?"
-
-Available columns: {', '.join(column_names) if column_names else 'None provided'}
-Always use specific data from these columns to answer questions."""
-        
-        elif data_type == "Sales Data":
-            return f"""You are an intelligent sales data assistant for Provolx.
-You're analyzing {name or 'sales data'} which contains SALES DATA.
-
-Adapt your responses to sales context:
-- Use sales terminology (transactions, pricing, dealers, commissions)
-- Focus on sales performance, revenue trends, customer preferences
-- Calculate total sales, average transaction value, conversion rates
-- Identify top-selling models, dealer performance, seasonal trends
-- Analyze pricing strategies, customer demographics, financing options
-- Use a professional, sales-focused tone
-
-Example questions you should handle naturally:
-- "Show me sales summary"
-- "Calculate total revenue"
-- "What are the trends?"
-- "Show top dealers"
-- "List high-value transactions"
-- "What's the average sale price?"
-
-Available columns: {', '.join(column_names) if column_names else 'None provided'}
-Always use specific data from these columns to answer questions."""
-        
-        elif data_type == "Inventory Data":
-            return f"""You are an intelligent inventory management assistant for Provolx.
-You're analyzing {name or 'inventory data'} which contains INVENTORY DATA.
-
-Adapt your responses to inventory context:
-- Use inventory terminology (parts, stock levels, suppliers, SKUs)
-- Focus on stock availability, supply chain management, inventory value
-- Calculate total inventory value, stock turnover, reorder needs
-- Identify low stock items, overstock situations, fast-moving parts
-- Analyze supplier performance, seasonal demand patterns
-- Use a professional, inventory-focused tone
-
-Example questions you should handle naturally:
-- "Show me inventory status"
-- "Calculate total inventory value"
-- "What needs reordering?"
-- "Show fast-moving parts"
-- "List overstock items"
-- "What's the stock turnover rate?"
-
-Available columns: {', '.join(column_names) if column_names else 'None provided'}
-Always use specific data from these columns to answer questions."""
-        
-        else:
-            return f"""You are an intelligent data analysis assistant for Provolx.
-You're analyzing {name or 'data'} which contains GENERAL DATA.
-
-Adapt your responses to general data analysis:
-- Focus on patterns, trends, and insights in the data
-- Calculate relevant statistics, identify outliers, find correlations
-- Provide clear, actionable recommendations
-- Use appropriate terminology for the data context
-- Always base your responses on the actual data provided
+        return self.prompts.context_prompt(data_type, column_key(columns), name)
 
-Available columns: {', '.join(column_names) if column_names else 'None provided'}
-Always use specific data from these columns to answer questions."""
+    def prepare_context(self, sheet_data: SheetData = None) -> Dict[str, Optional[str]]:
+        """The per-sheet parts of the prompt: detected data type, context prompt and sheet section.
 
-    async def chat(self, message: str, token: str, conversation_history: List[Dict] = None, sheet_data: SheetData = None):
-        """Process chat with Gemini AI and generate response with optional visualization"""
-        try:
-            # Prepare context based on sheet data
-            context_prompt = self.system_prompt
-            
-            if sheet_data and sheet_data.columns:
-                data_type = self.detect_data_type(sheet_data.columns, sheet_data.dataPreview)
-                context_prompt = self.get_context_aware_prompt(
-                    data_type, sheet_data.columns, sheet_data.name
-                )
-            
-            # Prepare conversation history
-            history_text = ""
-            if conversation_history:
-                history_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in conversation_history])
-            
-            # Prepare sheet data context
-            sheet_context = ""
-            if sheet_data and sheet_data.dataPreview:
-                sheet_context = f"""
+        Depends only on the sheet, so a batch of questions computes it once.
+        """
+        # Prepare context based on sheet data
+        context_prompt = self.system_prompt
+        columns_text = 'None provided'
+        data_type = None
+        
+        if sheet_data and sheet_data.columns:
+            column_names = column_key(sheet_data.columns)
+            columns_text = self.prompts.columns_text(column_names)
+            with service_metrics.stage("detect_data_type"):
+                data_type = sheet_data.data_types(self.classify_data_type)[0][0]
+            context_prompt = self.prompts.context_prompt(data_type, column_names, sheet_data.name)
+        
+        # Prepare sheet data context: statistics over every row instead of raw rows,
+        # so the prompt stays the same size however large the sheet is
+        sheet_context = ""
+        if sheet_data and sheet_data.dataPreview:
+            sheet_context = f"""
 Sheet Data Context:
 - Sheet Name: {sheet_data.name or 'Unnamed Sheet'}
-- Row Count: {sheet_data.rowCount or 'Unknown'}
-- Columns: {', '.join([col.get('name', 'Unnamed') for col in sheet_data.columns]) if sheet_data.columns else 'None provided'}
-- Data Preview: {str(sheet_data.dataPreview[:3]) if sheet_data.dataPreview else 'No data provided'}
+- Row Count: {sheet_data.rowCount or len(sheet_data.dataPreview)}
+- Columns: {columns_text}
+- Sample Rows: {str(sheet_data.dataPreview[:3])}
 """
-            
-            # Create full prompt
-            full_prompt = f"""
+            try:
+                with service_metrics.stage("sheet_stats"):
+                    row_count, stats = len(sheet_data.data()), sheet_data.stats()
+            except Exception as e:
+                # Rows pandas cannot tabulate (ragged, nested, duplicate columns): the sample rows have to do
+                logger.warning("Could not compute sheet statistics, sending sample rows only", extra={"error": str(e)})
+            else:
+                sheet_context += f"""
+Column Statistics (computed over all {row_count:,} rows provided):
+{format_stats_for_prompt(stats)}
+"""
+        return {"data_type": data_type, "context_prompt": context_prompt, "sheet_context": sheet_context}
+
+    async def prepare_context_async(self, sheet_data: SheetData = None) -> Dict[str, Optional[str]]:
+        """prepare_context in a thread: tabulating and summarizing a large inline sheet
+        would otherwise stall the event loop and every other request on it"""
+        return await asyncio.to_thread(self.prepare_context, sheet_data)
+
+    def build_prompt(self, message: str, conversation_history: List[Dict] = None, sheet_data: SheetData = None, session_key: str = None, context: Dict[str, Optional[str]] = None) -> str:
+        """Assemble the full Gemini prompt from context, history and sheet data"""
+        context = context or self.prepare_context(sheet_data)
+        context_prompt, sheet_context = context["context_prompt"], context["sheet_context"]
+        
+        # Prepare conversation history within whatever token budget the rest of the prompt leaves
+        history_text = ""
+        if conversation_history:
+            fixed_tokens = estimate_tokens(context_prompt + sheet_context + message + RESPONSE_INSTRUCTIONS) + PROMPT_OVERHEAD_TOKENS
+            history_text = self.history.render(
+                conversation_history,
+                session_key or HistoryManager.session_key(None, "", conversation_history),
+                token_budget=PROMPT_TOKEN_LIMIT - fixed_tokens
+            )
+        
+        # Create full prompt; the context prompt leads so its static prefix is shared between requests
+        return f"""
 {context_prompt}
 
 Conversation History:
@@ -308,95 +410,342 @@ Conversation History:
 
 User Question: {message}
 
-Please provide a helpful response. If the question involves data analysis that would benefit from visualization, 
-please suggest creating a chart or graph and describe what type of visualization would be most appropriate.
+{RESPONSE_INSTRUCTIONS}
 """
+
+    def wants_visualization(self, message: str, sheet_data: SheetData = None) -> bool:
+        """Check whether the question asks for a chart and there is data to plot"""
+        if not sheet_data or not sheet_data.dataPreview:
+            return False
+        lowered = message.lower()
+        return "chart" in lowered or "graph" in lowered or "visualize" in lowered
+
+    async def answer_locally(self, message: str, sheet_data: SheetData = None) -> Optional[str]:
+        """Answer simple aggregation questions from the sheet without calling Gemini.
+
+        Only when the request holds the whole sheet: an inline sheet whose rowCount
+        exceeds the rows sent goes to Gemini, which is told the real row count.
+        """
+        if not LOCAL_QUERY_ENABLED or not sheet_data or not sheet_data.dataPreview:
+            return None
+        # Questions the engine cannot parse never pay for building the rows
+        if not self.local_query.accepts(message):
+            return None
+        started = time.perf_counter()
+        try:
+            with service_metrics.stage("local_query"):
+                # Building a large inline sheet's DataFrame takes long enough to stall the event loop
+                answer = await asyncio.to_thread(
+                    lambda: self.local_query.answer(message, sheet_data.data(), row_count=sheet_data.rowCount)
+                )
+        except Exception as e:
+            logger.warning("Local query failed, falling back to Gemini", extra={"error": str(e)})
+            return None
+        if answer is not None:
+            model_router.record_local(time.perf_counter() - started)
+        return answer
+    
+    async def find_similar(self, message: str, conversation_history: List[Dict] = None, sheet_data: SheetData = None):
+        """Look a question up in the semantic cache; returns (scope, candidate), scope None when not cacheable"""
+        # Follow-up questions depend on the conversation, so only standalone ones are shared
+        if not semantic_cache.enabled or conversation_history:
+            return None, None
+        # Hashing a large inline sheet's rows takes long enough to stall the event loop
+        scope = await asyncio.to_thread(sheet_data.fingerprint) if sheet_data and sheet_data.dataPreview else "no-sheet"
+        with service_metrics.stage("semantic_lookup"):
+            similar = semantic_cache.lookup(message, scope)
+        result = "miss" if similar is None else "hit" if similar.hit else "near_miss"
+        service_metrics.semantic_lookups.inc(result=result)
+        if similar is not None:
+            service_metrics.semantic_similarity.observe(similar.similarity, result=result)
+        return scope, similar
+    
+    def remember_answer(self, message: str, scope: Optional[str], similar: Optional[SimilarAnswer], answer: str, model_name: str):
+        """Store a fresh model answer for similar questions, first scoring the candidate it was not served in place of"""
+        if scope is None:
+            return
+        if similar is not None:
+            agreement = jaccard(set(normalize(answer)), set(normalize(similar.answer)))
+            band = f"{math.floor(similar.similarity * 10) / 10:.1f}"
+            service_metrics.semantic_agreement.observe(agreement, similarity=band)
+            if should_log(logger):
+                logger.info("Semantic cache comparison", extra={
+                    "mode": semantic_cache.mode, "similarity": similar.similarity,
+                    "would_hit": similar.hit, "answer_agreement": round(agreement, 4)
+                })
+        semantic_cache.store(message, scope, answer, model_name)
+    
+    def choose_tier(self, message: str, prompt_tokens: int, data_type: Optional[str] = None) -> ModelTier:
+        """Pick the model tier for a prompt the local fast path could not answer"""
+        return model_router.route(prompt_tokens, message, data_type)
+
+    async def chat(self, message: str, token: str, conversation_history: List[Dict] = None, sheet_data: SheetData = None, session_id: str = None, visualization_mode: str = "inline", context: Dict[str, Optional[str]] = None, allow_visualization: bool = True):
+        """Process chat with Gemini AI and generate response with optional visualization"""
+        # Render the chart concurrently with answer generation rather than after it
+        visualization_task = None
+        if allow_visualization and self.wants_visualization(message, sheet_data):
+            visualization_task = asyncio.ensure_future(self.visualize(sheet_data, visualization_mode))
+        
+        try:
+            answer = await self.answer_locally(message, sheet_data)
+            scope, similar = None, None
+            if answer is None:
+                scope, similar = await self.find_similar(message, conversation_history, sheet_data)
+            if answer is not None:
+                model_name, source = LOCAL_MODEL_NAME, "local"
+            elif similar is not None and similar.hit and semantic_cache.serving:
+                answer, model_name, source = similar.answer, similar.model, "semantic"
+            else:
+                context = context or await self.prepare_context_async(sheet_data)
+                with service_metrics.stage("build_prompt"):
+                    full_prompt = self.build_prompt(
+                        message, conversation_history, sheet_data,
+                        session_key=HistoryManager.session_key(session_id, token, conversation_history or []),
+                        context=context
+                    )
+                    prompt_tokens = estimate_tokens(full_prompt)
+                tier = self.choose_tier(message, prompt_tokens, context["data_type"])
+                model_name = tier.model_name
+                
+                with service_metrics.stage("cache_lookup"):
+                    cache_key = response_cache.key_for(full_prompt, model_name)
+                    cached = await response_cache.get(cache_key)
+                if cached:
+                    answer, source = cached["answer"], "cache"
+                else:
+                    async def generate():
+                        # Generate response using Gemini off the event loop
+                        service_metrics.prompt_chars.inc(len(full_prompt), tier=tier.name)
+                        service_metrics.prompt_tokens.inc(prompt_tokens, tier=tier.name)
+                        started = time.perf_counter()
+                        try:
+                            response = await gemini_guard.run(
+                                lambda: generation_executor.run(tier.provider.generate, full_prompt),
+                                cost=prompt_tokens
+                            )
+                        except Exception:
+                            model_router.record(tier, time.perf_counter() - started, prompt_tokens, 0, error=True)
+                            raise
+                        model_router.record(tier, time.perf_counter() - started, prompt_tokens, estimate_tokens(response))
+                        await response_cache.set(cache_key, {"answer": response})
+                        return response
+                    
+                    # Includes rate-limit waits, retries and time spent waiting on a coalesced call
+                    with service_metrics.stage("model"):
+                        answer, source = await generation_flight.do(cache_key, generate), "gemini"
+                    self.remember_answer(message, scope, similar, answer, model_name)
             
-            # Generate response using Gemini
-            response = model.generate_content(full_prompt)
-            
-            # Check if we should generate a visualization
-            visualization = None
-            if sheet_data and sheet_data.dataPreview and "chart" in message.lower() or "graph" in message.lower() or "visualize" in message.lower():
-                visualization = self.generate_visualization(sheet_data)
+            # Only the part of rendering that outlasted the answer
+            with service_metrics.stage("visualization_wait"):
+                visualization = await visualization_task if visualization_task else await self.visualization_payload(None)
             
             return {
-                "answer": response.text,
-                "model": "gemini-2.0-flash-exp",
-                "visualization": visualization
+                "answer": answer,
+                "model": model_name,
+                **visualization,
+                "cached": source in ("cache", "semantic"),
+                "source": source
             }
             
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
-            print(f"Error in Gemini AI chat: {str(e)}")
+            logger.exception("Error in Gemini AI chat")
             raise Exception(f"AI processing error: {str(e)}")
+        finally:
+            if visualization_task and not visualization_task.done():
+                visualization_task.cancel()
+
+    async def chat_stream(self, message: str, token: str, conversation_history: List[Dict] = None, sheet_data: SheetData = None, session_id: str = None, visualization_mode: str = "inline"):
+        """Stream the Gemini answer as it is generated.
+
+        Yields ("meta", {"model", "source"}) first, then ("chunk", text) for
+        every piece of the answer, then ("visualization", fields) if a chart
+        was requested.
+        """
+        visualization_task = None
+        if self.wants_visualization(message, sheet_data):
+            visualization_task = asyncio.ensure_future(self.visualize(sheet_data, visualization_mode))
+        
+        try:
+            async for event in self._stream_answer(message, token, conversation_history, sheet_data, session_id):
+                yield event
+            
+            if visualization_task:
+                visualization = await visualization_task
+                if any(visualization.values()):
+                    yield "visualization", visualization
+        finally:
+            if visualization_task and not visualization_task.done():
+                visualization_task.cancel()
+    
+    async def _stream_answer(self, message: str, token: str, conversation_history: List[Dict] = None, sheet_data: SheetData = None, session_id: str = None):
+        answer = await self.answer_locally(message, sheet_data)
+        scope, similar = None, None
+        if answer is None:
+            scope, similar = await self.find_similar(message, conversation_history, sheet_data)
+        if answer is not None:
+            yield "meta", {"model": LOCAL_MODEL_NAME, "source": "local"}
+            yield "chunk", answer
+        elif similar is not None and similar.hit and semantic_cache.serving:
+            yield "meta", {"model": similar.model, "source": "semantic"}
+            yield "chunk", similar.answer
+        else:
+            context = await self.prepare_context_async(sheet_data)
+            with service_metrics.stage("build_prompt"):
+                full_prompt = self.build_prompt(
+                    message, conversation_history, sheet_data,
+                    session_key=HistoryManager.session_key(session_id, token, conversation_history or []),
+                    context=context
+                )
+                prompt_tokens = estimate_tokens(full_prompt)
+            tier = self.choose_tier(message, prompt_tokens, context["data_type"])
+            model_name = tier.model_name
+            
+            with service_metrics.stage("cache_lookup"):
+                cache_key = response_cache.key_for(full_prompt, model_name)
+                cached = await response_cache.get(cache_key)
+            if cached:
+                yield "meta", {"model": model_name, "source": "cache"}
+                yield "chunk", cached["answer"]
+            else:
+                # Chunks already sent cannot be taken back, so streams are not retried
+                service_metrics.prompt_chars.inc(len(full_prompt), tier=tier.name)
+                service_metrics.prompt_tokens.inc(prompt_tokens, tier=tier.name)
+                started = time.perf_counter()
+                await gemini_guard.admit(prompt_tokens)
+                yield "meta", {"model": model_name, "source": "gemini"}
+                parts = []
+                try:
+                    async for text in generation_executor.iterate(tier.provider.stream, full_prompt):
+                        parts.append(text)
+                        yield "chunk", text
+                except Exception as e:
+                    gemini_guard.record(e)
+                    model_router.record(tier, time.perf_counter() - started, prompt_tokens, 0, error=True)
+                    raise
+                gemini_guard.record()
+                service_metrics.stage_seconds.observe(time.perf_counter() - started, stage="model_stream")
+                model_router.record(tier, time.perf_counter() - started, prompt_tokens, estimate_tokens("".join(parts)))
+                answer = "".join(parts)
+                await response_cache.set(cache_key, {"answer": answer})
+                self.remember_answer(message, scope, similar, answer, model_name)
     
-    def generate_visualization(self, sheet_data: SheetData) -> Optional[str]:
-        """Generate a visualization based on sheet data"""
+    async def generate_visualization(self, sheet_data: SheetData) -> Optional[str]:
+        """Generate a visualization based on sheet data and return its ID (fetchable from /visualizations/{id})"""
         try:
-            if not sheet_data or not sheet_data.dataPreview:
+            if not sheet_data or not sheet_data.columns or not sheet_data.dataPreview:
                 return None
             
-            # Convert data to DataFrame for easier manipulation
-            if sheet_data.columns and sheet_data.dataPreview:
-                # Create DataFrame from columns and data
-                column_names = [col.get('name', f'Column_{i}') for i, col in enumerate(sheet_data.columns)]
-                df = pd.DataFrame(sheet_data.dataPreview, columns=column_names)
-                
-                # Try to create a simple visualization
-                plt.figure(figsize=(10, 6))
-                
-                # If we have numerical data, create a histogram or bar chart
-                numerical_columns = df.select_dtypes(include=['number']).columns
-                if len(numerical_columns) > 0:
-                    # Create histogram for the first numerical column
-                    plt.hist(df[numerical_columns[0]].dropna(), bins=20, alpha=0.7)
-                    plt.title(f'Distribution of {numerical_columns[0]}')
-                    plt.xlabel(numerical_columns[0])
-                    plt.ylabel('Frequency')
-                else:
-                    # Create bar chart for categorical data
-                    categorical_columns = df.select_dtypes(include=['object']).columns
-                    if len(categorical_columns) > 0:
-                        value_counts = df[categorical_columns[0]].value_counts().head(10)
-                        plt.bar(range(len(value_counts)), value_counts.values)
-                        plt.title(f'Top 10 {categorical_columns[0]} Values')
-                        plt.xlabel(categorical_columns[0])
-                        plt.ylabel('Count')
-                        plt.xticks(range(len(value_counts)), value_counts.index, rotation=45)
-                
-                plt.tight_layout()
-                
-                # Save plot to base64 string
-                buf = io.BytesIO()
-                plt.savefig(buf, format='png')
-                buf.seek(0)
-                img_base64 = base64.b64encode(buf.read()).decode('utf-8')
-                plt.close()
-                
-                return img_base64
+            # Same data renders the same chart: a hit skips the DataFrame and matplotlib entirely
+            # Hashing and aggregating a large inline sheet would stall the event loop
+            cache_key = chart_cache_key(await asyncio.to_thread(sheet_data.fingerprint))
+            image = await chart_cache.get(cache_key)
             
+            if image is None:
+                # Aggregate here (vectorized, cheap); draw in a render worker process
+                spec = await asyncio.to_thread(lambda: chart_spec(sheet_data.data()))
+                if spec is None:
+                    return None
+                image = await chart_renderer.render(spec)
+                if image is None:
+                    return None
+                await chart_cache.set(cache_key, image)
+            
+            return cache_key
+        except Exception:
+            logger.exception("Error generating visualization")
             return None
-        except Exception as e:
-            print(f"Error generating visualization: {str(e)}")
-            return None
+    
+    async def visualize(self, sheet_data: SheetData, mode: str = "inline") -> Dict[str, Any]:
+        """Chart response fields for the requested visualization mode"""
+        with service_metrics.stage("visualization"):
+            if mode != "spec":
+                return await self.visualization_payload(await self.generate_visualization(sheet_data), mode)
+            
+            # Client-side rendering: only the aggregates are sent, matplotlib never runs
+            try:
+                if sheet_data and sheet_data.columns and sheet_data.dataPreview:
+                    spec = await asyncio.to_thread(lambda: chart_spec(sheet_data.data()))
+                    if spec is not None:
+                        return {**await self.visualization_payload(None), "visualization_spec": vega_lite_spec(spec)}
+            except Exception:
+                logger.exception("Error generating visualization spec")
+            return await self.visualization_payload(None)
+    
+    async def visualization_payload(self, chart_id: Optional[str], mode: str = "inline") -> Dict[str, Any]:
+        """Response fields for a rendered chart: always its ID and URL, plus inline base64 in "inline" mode"""
+        if not chart_id:
+            return {"visualization": None, "visualization_id": None, "visualization_url": None, "visualization_spec": None}
+        inline = None
+        if mode == "inline":
+            image = await chart_cache.get(chart_id)
+            inline = base64.b64encode(image).decode('utf-8') if image else None
+        return {
+            "visualization": inline,
+            "visualization_id": chart_id,
+            "visualization_url": f"/visualizations/{chart_id}",
+            "visualization_spec": None
+        }
 
 # Initialize Gemini AI Engine
 ai_engine = GeminiAIEngine()
 
+# Sheets uploaded once via POST /sheets and referenced by ID in chat requests
+# Large files uploaded via POST /sheets/upload are streamed into Arrow files here
+sheet_store = SheetStore(
+    root=os.getenv("SHEET_STORE_DIR") or os.path.join(tempfile.gettempdir(), "provolx-sheets"),
+    chunk_rows=int(os.getenv("SHEET_INGEST_CHUNK_ROWS", 50000)),
+    max_bytes=int(os.getenv("SHEET_UPLOAD_MAX_BYTES", 512 * 1024 * 1024))
+)
+
+def remove_sheet_files(sheet):
+    if sheet.store_dir:
+        sheet_store.remove(sheet.store_dir)
+
+sheet_registry = SheetRegistry(
+    max_sheets=int(os.getenv("SHEET_REGISTRY_MAX_SHEETS", 256)),
+    max_bytes=int(os.getenv("SHEET_REGISTRY_MAX_BYTES", 1024 * 1024 * 1024)),
+    on_remove=remove_sheet_files
+)
+
+def resolve_sheet(request) -> Optional[SheetData]:
+    """Return the sheet for a chat request, looking up sheetId in the registry"""
+    if request.sheetId:
+        stored = sheet_registry.get(request.sheetId)
+        if stored is None:
+            raise HTTPException(status_code=404, detail=f"Unknown sheetId: {request.sheetId}")
+        return stored.sheet_data
+    return request.sheetData
+
+def record_visualization(fields: Dict[str, Any]):
+    """Count the chart bytes carried in a chat response"""
+    if fields.get("visualization"):
+        service_metrics.visualization_bytes.inc(len(fields["visualization"]), mode="inline")
+    if fields.get("visualization_spec"):
+        service_metrics.visualization_bytes.inc(len(json.dumps(fields["visualization_spec"])), mode="spec")
+
 @app.get("/")
 def root():
     return {
         "message": "Provolx AI Assistant API - Powered by Gemini 2.0 Flash",
         "status": "active",
         "version": "2.0.0",
-        "model": "gemini-2.0-flash-exp"
+        "model": model_provider.model_name
     }
 
+def require_admin(token: Optional[str]):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token or not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
 @app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, response: Response, x_profile: Optional[str] = Header(None)):
     """
     AI Chat endpoint with Gemini 2.0 Flash
     """
+    service_metrics.request_parsed()
     try:
         if not request.message.strip():
             raise HTTPException(status_code=400, detail="Message cannot be empty")
@@ -404,46 +753,417 @@ async def chat(request: ChatRequest):
         if not request.token:
             raise HTTPException(status_code=401, detail="Authentication token required")
         
-        # Log incoming request
-        print(f"📨 Received AI request:")
-        print(f"   - Message: {request.message[:50]}...")
-        print(f"   - Has sheetData: {request.sheetData is not None}")
-        if request.sheetData:
-            print(f"   - Sheet name: {request.sheetData.name or 'Unknown'}")
-            print(f"   - Sheet rows: {request.sheetData.rowCount or 0}")
-            print(f"   - DataPreview length: {len(request.sheetData.dataPreview) if request.sheetData.dataPreview else 0}")
+        with service_metrics.stage("resolve_sheet"):
+            sheet_data = resolve_sheet(request)
+        
+        # Sizes only: question and answer text stay out of the logs
+        if should_log(logger):
+            logger.info("Received AI request", extra={
+                "message_chars": len(request.message),
+                "sheet_id": request.sheetId,
+                "sheet_rows": sheet_data.rowCount if sheet_data else None,
+                "preview_rows": len(sheet_data.dataPreview) if sheet_data and sheet_data.dataPreview else 0,
+                "history_turns": len(request.conversation_history or [])
+            })
         
         # Process with Gemini AI
-        result = await ai_engine.chat(
+        chat_call = ai_engine.chat(
             request.message, 
             request.token,
             conversation_history=[msg.dict() for msg in request.conversation_history] if request.conversation_history else [],
-            sheet_data=request.sheetData
+            sheet_data=sheet_data,
+            session_id=request.sessionId,
+            visualization_mode=request.visualizationMode
         )
+        if request_profiler.should_profile(x_profile):
+            # Labelled by sheet shape rather than the question, which may hold customer data
+            shape = f"{sheet_data.rowCount or 0} rows x {len(sheet_data.columns or [])} columns" if sheet_data else "no sheet"
+            async with request_profiler.profile(f"/chat ({shape})") as profile:
+                result = await chat_call
+            if profile.profile_id:
+                response.headers["X-Profile-Id"] = profile.profile_id
+        else:
+            result = await chat_call
         
-        print(f"✅ Generated response: {result.get('answer', 'No answer')[:100]}...")
+        if should_log(logger):
+            logger.info("Generated response", extra={
+                "source": result.get('source'),
+                "model": result.get('model'),
+                "answer_chars": len(result.get('answer') or ''),
+                "visualization": bool(result.get('visualization_id') or result.get('visualization_spec'))
+            })
+        service_metrics.chat_requests.inc(endpoint="chat", source=result.get('source', 'gemini'))
+        record_visualization(result)
         
+        service_metrics.handler_finished()
         return ChatResponse(
             answer=result['answer'],
-            model=result.get('model', 'gemini-2.0-flash-exp'),
+            model=result.get('model', model_provider.model_name),
             timestamp=datetime.now().isoformat(),
-            visualization=result.get('visualization')
+            visualization=result.get('visualization'),
+            visualizationId=result.get('visualization_id'),
+            visualizationUrl=result.get('visualization_url'),
+            visualizationSpec=result.get('visualization_spec'),
+            cached=result.get('cached', False),
+            source=result.get('source', 'gemini')
         )
     
     except HTTPException:
+        service_metrics.chat_errors.inc(endpoint="chat", kind="rejected")
         raise
+    except UpstreamUnavailable as e:
+        logger.warning("Gemini unavailable", extra={"error": str(e), "retry_after": e.retry_after})
+        service_metrics.chat_errors.inc(endpoint="chat", kind="upstream_unavailable")
+        raise HTTPException(
+            status_code=503,
+            detail=f"AI service temporarily unavailable: {str(e)}",
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
     except Exception as e:
-        print(f"Error: {str(e)}")
+        logger.error("Chat request failed", extra={"error": str(e)})
+        service_metrics.chat_errors.inc(endpoint="chat", kind="error")
         raise HTTPException(status_code=500, detail=f"AI processing error: {str(e)}")
 
+@app.post("/chat/batch", response_model=BatchChatResponse)
+async def chat_batch(request: BatchChatRequest):
+    """
+    Answer many independent questions about one sheet.
+    The sheet context is prepared once and the questions run concurrently
+    (at most BATCH_MAX_CONCURRENCY at a time); a failing question reports its
+    error without failing the batch.
+    """
+    service_metrics.request_parsed()
+    if not request.token:
+        raise HTTPException(status_code=401, detail="Authentication token required")
+    
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="At least one question is required")
+    
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+    
+    sheet_data = resolve_sheet(request)
+    logger.info("Received batch AI request", extra={"questions": len(request.questions), "sheet_id": request.sheetId})
+    
+    started = time.perf_counter()
+    context = await ai_engine.prepare_context_async(sheet_data)
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+    
+    async def answer(index: int, question: str) -> BatchChatItem:
+        async with semaphore:
+            item_started = time.perf_counter()
+            try:
+                if not question.strip():
+                    raise ValueError("Message cannot be empty")
+                result = await ai_engine.chat(
+                    question,
+                    request.token,
+                    sheet_data=sheet_data,
+                    context=context,
+                    allow_visualization=False
+                )
+                service_metrics.chat_requests.inc(endpoint="batch", source=result['source'])
+            except Exception as e:
+                service_metrics.chat_errors.inc(
+                    endpoint="batch", kind="upstream_unavailable" if isinstance(e, UpstreamUnavailable) else "error"
+                )
+                return BatchChatItem(
+                    index=index,
+                    question=question,
+                    elapsedMs=round((time.perf_counter() - item_started) * 1000, 1),
+                    error=str(e)
+                )
+            return BatchChatItem(
+                index=index,
+                question=question,
+                answer=result['answer'],
+                model=result['model'],
+                source=result['source'],
+                cached=result['cached'],
+                elapsedMs=round((time.perf_counter() - item_started) * 1000, 1)
+            )
+    
+    results = await asyncio.gather(*[answer(i, question) for i, question in enumerate(request.questions)])
+    
+    logger.info("Answered batch", extra={
+        "questions": len(results),
+        "failed": sum(item.error is not None for item in results),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    })
+    
+    service_metrics.handler_finished()
+    return BatchChatResponse(
+        results=results,
+        dataType=context["data_type"],
+        elapsedMs=round((time.perf_counter() - started) * 1000, 1),
+        timestamp=datetime.now().isoformat()
+    )
+
+@app.post("/sheets")
+def upload_sheet(sheet: SheetData):
+    """
+    Store a sheet server-side so chat requests can send `sheetId` instead of
+    re-uploading columns and dataPreview on every turn.
+    """
+    if not sheet.columns:
+        raise HTTPException(status_code=400, detail="Sheet must have columns")
+    
+    try:
+        stored = sheet_registry.register(sheet)
+    except SheetError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info("Stored sheet", extra={"sheet_id": stored.sheet_id, "rows": stored.rows})
+    return {
+        **stored.summary(),
+        "dataTypes": sheet.data_types(ai_engine.classify_data_type)
+    }
+
+@app.post("/sheets/upload")
+def upload_sheet_file(file: UploadFile = File(...), name: Optional[str] = Form(None)):
+    """
+    Store a large CSV, TSV, JSON-lines or XLSX file server-side.
+    The file is parsed in chunks into a memory-mapped Arrow file rather
+    than sent as JSON rows; use the returned `sheetId` in chat requests.
+    """
+    try:
+        ingested = sheet_store.ingest(file.file, file.filename)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except IngestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.warning("Could not ingest upload", extra={"filename": file.filename, "error": str(e)})
+        raise HTTPException(status_code=400, detail=f"Could not parse file: {str(e)}")
+    
+    try:
+        sheet = SheetData.from_ingested(ingested, name=name or file.filename)
+        stored = sheet_registry.register(sheet, store_dir=ingested.directory)
+    except Exception as e:
+        # Nothing references the ingested file yet, so it would stay in SHEET_STORE_DIR
+        sheet_store.remove(ingested.directory)
+        if isinstance(e, SheetError):
+            raise HTTPException(status_code=400, detail=str(e))
+        raise
+    logger.info("Ingested sheet", extra={
+        "sheet_id": stored.sheet_id,
+        "rows": ingested.row_count,
+        "columns": len(ingested.columns)
+    })
+    return {
+        **stored.summary(),
+        "dataTypes": sheet.data_types(ai_engine.classify_data_type)
+    }
+
+@app.get("/sheets/{sheet_id}")
+def get_sheet(sheet_id: str):
+    stored = sheet_registry.get(sheet_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail=f"Unknown sheetId: {sheet_id}")
+    return stored.summary()
+
+@app.delete("/sheets/{sheet_id}")
+def delete_sheet(sheet_id: str):
+    if not sheet_registry.remove(sheet_id):
+        raise HTTPException(status_code=404, detail=f"Unknown sheetId: {sheet_id}")
+    return {"deleted": sheet_id}
+
+def if_none_match_tags(header: Optional[str]) -> set:
+    """Entity tags listed in an If-None-Match header. The comparison is weak, so a
+    W/ prefix is dropped; "*" is kept as is"""
+    tags = set()
+    for tag in (header or "").split(","):
+        tag = tag.strip()
+        tags.add(tag[2:] if tag.startswith("W/") else tag)
+    return tags
+
+@app.get("/visualizations/{visualization_id}")
+async def get_visualization(visualization_id: str, request: Request):
+    """
+    Serve a rendered chart as raw PNG. IDs are content hashes, so the bytes
+    behind an ID never change and can be cached indefinitely.
+    """
+    if not CHART_ID_PATTERN.fullmatch(visualization_id):
+        raise HTTPException(status_code=404, detail="Unknown visualization")
+    
+    etag = f'"{visualization_id}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    tags = if_none_match_tags(request.headers.get("if-none-match"))
+    if etag in tags:
+        return Response(status_code=304, headers=headers)
+    
+    image = await chart_cache.get(visualization_id)
+    if image is None:
+        raise HTTPException(status_code=404, detail="Unknown visualization")
+    # "*" matches any current representation, so only once the chart is known to exist
+    if "*" in tags:
+        return Response(status_code=304, headers=headers)
+    service_metrics.visualization_bytes.inc(len(image), mode="png")
+    return Response(content=image, media_type="image/png", headers=headers)
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format a single Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Streaming AI Chat endpoint (Server-Sent Events).
+    Emits `chunk` events as Gemini generates the answer, an optional
+    `visualization` event, then a final `done` (or `error`) event.
+    """
+    service_metrics.request_parsed()
+    if not request.message.strip():
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
+    
+    if not request.token:
+        raise HTTPException(status_code=401, detail="Authentication token required")
+    
+    sheet_data = resolve_sheet(request)
+    
+    logger.info("Received streaming AI request", extra={"message_chars": len(request.message), "sheet_id": request.sheetId})
+    
+    async def events():
+        meta = {"model": model_provider.model_name, "source": "gemini"}
+        try:
+            async for kind, payload in ai_engine.chat_stream(
+                request.message,
+                request.token,
+                conversation_history=[msg.dict() for msg in request.conversation_history] if request.conversation_history else [],
+                sheet_data=sheet_data,
+                session_id=request.sessionId,
+                visualization_mode=request.visualizationMode
+            ):
+                if kind == "meta":
+                    meta = payload
+                elif kind == "chunk":
+                    yield sse_event("chunk", {"text": payload})
+                else:
+                    record_visualization(payload)
+                    yield sse_event("visualization", {
+                        "visualization": payload["visualization"],
+                        "visualizationId": payload["visualization_id"],
+                        "visualizationUrl": payload["visualization_url"],
+                        "visualizationSpec": payload["visualization_spec"]
+                    })
+            
+            service_metrics.chat_requests.inc(endpoint="stream", source=meta["source"])
+            yield sse_event("done", {
+                **meta,
+                "timestamp": datetime.now().isoformat()
+            })
+        except UpstreamUnavailable as e:
+            logger.warning("Gemini unavailable", extra={"error": str(e), "retry_after": e.retry_after})
+            service_metrics.chat_errors.inc(endpoint="stream", kind="upstream_unavailable")
+            yield sse_event("error", {
+                "detail": f"AI service temporarily unavailable: {str(e)}",
+                "retryAfter": math.ceil(e.retry_after)
+            })
+        except Exception as e:
+            logger.error("Streaming chat failed", extra={"error": str(e)})
+            service_metrics.chat_errors.inc(endpoint="stream", kind="error")
+            yield sse_event("error", {"detail": f"AI processing error: {str(e)}"})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/health")
 def health_check():
     return {
         "status": "healthy",
-        "model": "gemini-2.0-flash-exp"
+        "model": model_provider.model_name,
+        "generation": generation_executor.stats(),
+        "coalescing": generation_flight.stats(),
+        "upstream": gemini_guard.stats(),
+        "routing": model_router.stats(),
+        "response_cache": response_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "sheets": sheet_registry.stats(),
+        "sheet_store": sheet_store.stats(),
+        "history": ai_engine.history.stats(),
+        "charts": chart_renderer.stats(),
+        "chart_cache": chart_cache.stats(),
+        "profiling": request_profiler.stats(),
+        "logging": log_settings.stats(),
+        "startup": {**startup_times, "warm": startup_times["warmup_seconds"] is not None}
     }
 
+@app.get("/admin/profiles")
+def list_profiles(x_admin_token: Optional[str] = Header(None)):
+    """Stored /chat profiles, newest first"""
+    require_admin(x_admin_token)
+    return {"profiles": request_profiler.list(), **request_profiler.stats()}
+
+@app.get("/admin/profiles/{profile_id}")
+def get_profile(profile_id: str, fmt: Literal["speedscope", "html", "text"] = Query("speedscope", alias="format"),
+                x_admin_token: Optional[str] = Header(None)):
+    """
+    One stored profile. `speedscope` JSON opens in https://www.speedscope.app;
+    `html` is pyinstrument's interactive call tree; `text` is a plain call tree.
+    """
+    require_admin(x_admin_token)
+    stored = request_profiler.get(profile_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail=f"Unknown profile: {profile_id}")
+    return Response(content=stored.render(fmt), media_type=PROFILE_FORMATS[fmt])
+
+@app.get("/admin/logging")
+def get_logging(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    return log_settings.stats()
+
+@app.put("/admin/logging")
+def update_logging(update: LoggingUpdate, x_admin_token: Optional[str] = Header(None)):
+    """Change the log level or sample rate at runtime, e.g. DEBUG for a 1% sample while investigating"""
+    require_admin(x_admin_token)
+    if update.sampleRate is not None:
+        if not 0 <= update.sampleRate <= 1:
+            raise HTTPException(status_code=400, detail="sampleRate must be between 0 and 1")
+        log_settings.sample_rate = update.sampleRate
+    if update.level:
+        log_settings.set_level(update.level)
+    logger.warning("Logging settings changed", extra={"log_level": log_settings.level, "sample_rate": log_settings.sample_rate})
+    return log_settings.stats()
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text-format metrics: per-stage and HTTP latency histograms, chat counters"""
+    return Response(content=service_metrics.render(), media_type=CONTENT_TYPE)
+
+def warm_up():
+    """Load pandas/NumPy and the model client so the first request does not pay for the imports"""
+    started = time.perf_counter()
+    try:
+        sample = SheetData(columns=[{"name": "value"}], dataPreview=[[1], [2]])
+        chart_spec(sample.frame())
+        sample.stats()
+        for tier in model_router.tiers:
+            tier.provider.warm_up()
+    except Exception as e:
+        logger.warning("Warmup failed", extra={"error": str(e)})
+        return
+    startup_times["warmup_seconds"] = round(time.perf_counter() - started, 3)
+    logger.info("Warmed up", extra={"warmup_seconds": startup_times["warmup_seconds"]})
+
+@app.on_event("startup")
+def startup():
+    # Fork the chart workers before the warmup thread starts the Gemini client
+    chart_renderer.start()
+    threading.Thread(target=warm_up, name="warmup", daemon=True).start()
+    startup_times["ready_seconds"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+
+@app.on_event("shutdown")
+def shutdown():
+    generation_executor.shutdown()
+    chart_renderer.shutdown()
+    log_settings.stop()
+
+startup_times["import_seconds"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8001))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    # log_config=None leaves uvicorn's loggers (access log included) to the JSON queue handler
+    uvicorn.run(app, host="0.0.0.0", port=port, log_config=None)
\ No newline at end of file
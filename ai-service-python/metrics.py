@@ -0,0 +1,229 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Seconds; wide enough for sub-millisecond stages and for model calls with retries
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Jaccard similarities, for the semantic answer cache
+SIMILARITY_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95, 1.0)
+
+# Starlette appends the charset
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: per-bucket counts (the last one is +Inf), sum, count
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, ([*counts], total, count)) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                bucket = _labels(self.labelnames, key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Counters and histograms rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics: List = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+class RequestTiming:
+    """Start of the current HTTP request, and when its handler finished"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.handler_done: Optional[float] = None
+
+
+_request_timing: ContextVar[Optional[RequestTiming]] = ContextVar("request_timing", default=None)
+
+
+class ServiceMetrics:
+    """The AI service's metrics: per-stage timings, HTTP latency and chat counters.
+
+    Stages are timed with `with metrics.stage("build_prompt"):`. Two stages
+    need the request boundaries from MetricsMiddleware: "request_parse" (from
+    the first byte of the request to the handler, covering body reading and
+    pydantic validation) and "serialize" (from `handler_finished()` to the
+    response being sent, covering response model validation and JSON encoding).
+    """
+
+    def __init__(self):
+        self.registry = MetricsRegistry()
+        self.stage_seconds = self.registry.histogram(
+            "provolx_stage_duration_seconds", "Time spent in each stage of answering a chat request", ["stage"])
+        self.http_seconds = self.registry.histogram(
+            "provolx_http_request_duration_seconds", "HTTP request latency until the response starts",
+            ["method", "route", "status"])
+        self.chat_requests = self.registry.counter(
+            "provolx_chat_requests_total", "Chat questions answered, by endpoint and answer source", ["endpoint", "source"])
+        self.chat_errors = self.registry.counter(
+            "provolx_chat_errors_total", "Chat questions that failed, by endpoint and kind", ["endpoint", "kind"])
+        self.prompt_chars = self.registry.counter(
+            "provolx_prompt_chars_total", "Characters of prompts sent to a model", ["tier"])
+        self.prompt_tokens = self.registry.counter(
+            "provolx_prompt_tokens_total", "Estimated tokens of prompts sent to a model", ["tier"])
+        self.visualization_bytes = self.registry.counter(
+            "provolx_visualization_bytes_total", "Bytes of charts returned (PNG, base64 or Vega-Lite JSON)", ["mode"])
+        self.semantic_lookups = self.registry.counter(
+            "provolx_semantic_cache_lookups_total",
+            "Semantic cache lookups: hit, near_miss (a candidate below the threshold) or miss", ["result"])
+        self.semantic_similarity = self.registry.histogram(
+            "provolx_semantic_cache_similarity", "Question similarity of the best semantic cache candidate", ["result"],
+            buckets=SIMILARITY_BUCKETS)
+        self.semantic_agreement = self.registry.histogram(
+            "provolx_semantic_cache_answer_agreement",
+            "Word overlap of a fresh answer with the candidate's cached answer (shadow mode), by question similarity",
+            ["similarity"], buckets=SIMILARITY_BUCKETS)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds.observe(time.perf_counter() - started, stage=name)
+
+    def request_parsed(self):
+        """Call first thing in a handler to record the "request_parse" stage"""
+        timing = _request_timing.get()
+        if timing is not None:
+            self.stage_seconds.observe(time.perf_counter() - timing.started, stage="request_parse")
+
+    def handler_finished(self):
+        """Call just before returning the response model to start the "serialize" stage"""
+        timing = _request_timing.get()
+        if timing is not None:
+            timing.handler_done = time.perf_counter()
+
+    def render(self) -> str:
+        return self.registry.render()
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing each HTTP request by route template, so IDs in paths do not add series"""
+
+    def __init__(self, app, metrics: ServiceMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming()
+        token = _request_timing.set(timing)
+        responded = False
+
+        def observe(status: int):
+            # FastAPI leaves the matched route in the scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            self.metrics.http_seconds.observe(time.perf_counter() - timing.started,
+                                              method=scope["method"], route=route, status=status)
+
+        async def send_timed(message):
+            nonlocal responded
+            if message["type"] == "http.response.start":
+                responded = True
+                if timing.handler_done is not None:
+                    self.metrics.stage_seconds.observe(time.perf_counter() - timing.handler_done, stage="serialize")
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        except Exception:
+            # Unhandled errors become a 500 further out, in the server error middleware
+            if not responded:
+                observe(500)
+            raise
+        finally:
+            _request_timing.reset(token)
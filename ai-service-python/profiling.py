@@ -0,0 +1,152 @@
+import hmac
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    "speedscope": "application/json",
+    "html": "text/html",
+    "text": "text/plain",
+}
+
+
+class StoredProfile:
+    """A finished profiling session; rendered on request, since rendering is slower than recording"""
+
+    def __init__(self, profile_id: str, label: str, session, elapsed: float):
+        self.profile_id = profile_id
+        self.label = label
+        self.session = session
+        self.elapsed = elapsed
+        self.created_at = datetime.now().isoformat()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "profileId": self.profile_id,
+            "label": self.label,
+            "elapsedMs": round(self.elapsed * 1000, 1),
+            "samples": self.session.sample_count,
+            "createdAt": self.created_at,
+        }
+
+    def render(self, fmt: str = "speedscope") -> str:
+        from pyinstrument import renderers
+
+        if fmt == "speedscope":
+            return renderers.SpeedscopeRenderer().render(self.session)
+        if fmt == "html":
+            return renderers.HTMLRenderer().render(self.session)
+        if fmt == "text":
+            return renderers.ConsoleRenderer(unicode=False, color=False).render(self.session)
+        raise ValueError(f"Unknown profile format: {fmt}")
+
+
+class ProfileHandle:
+    """Yielded while a request runs; `profile_id` is set when the request is actually being profiled"""
+
+    def __init__(self, profile_id: Optional[str] = None):
+        self.profile_id = profile_id
+
+
+class RequestProfiler:
+    """Runs selected requests under pyinstrument's sampling profiler.
+
+    A request is profiled when it carries the admin token in the profiling
+    header, or by chance with probability `sample_rate`. Only one request is
+    profiled at a time, so profiling cannot pile up under load; others run
+    normally meanwhile. The last `max_profiles` sessions are kept in memory.
+    With no token and a zero sample rate, `should_profile` returns False at
+    once and pyinstrument is never imported.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, token: Optional[str] = None, interval: float = 0.001,
+                 max_profiles: int = 20):
+        self.sample_rate = sample_rate
+        self.token = token
+        self.interval = interval
+        self.max_profiles = max_profiles
+        self._profiles: "OrderedDict[str, StoredProfile]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._busy = False
+        self.profiled = 0
+        self.skipped_busy = 0
+        self.unavailable = False
+
+    @property
+    def enabled(self) -> bool:
+        return not self.unavailable and (self.sample_rate > 0 or bool(self.token))
+
+    def should_profile(self, header_value: Optional[str] = None) -> bool:
+        if not self.enabled:
+            return False
+        if header_value and self.token and hmac.compare_digest(header_value, self.token):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    @asynccontextmanager
+    async def profile(self, label: str) -> AsyncIterator[ProfileHandle]:
+        """Profile the body of the `async with` block (including tasks it starts) if the profiler is free"""
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logger.warning("Request profiling requires pyinstrument (pip install pyinstrument); profiling disabled")
+            self.unavailable = True
+            yield ProfileHandle()
+            return
+
+        with self._lock:
+            busy = self._busy
+            if busy:
+                self.skipped_busy += 1
+            else:
+                self._busy = True
+        if busy:
+            yield ProfileHandle()
+            return
+
+        handle = ProfileHandle(uuid.uuid4().hex)
+        profiler = Profiler(interval=self.interval, async_mode="enabled")
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            yield handle
+        finally:
+            session = profiler.stop()
+            self._store(StoredProfile(handle.profile_id, label, session, time.perf_counter() - started))
+            with self._lock:
+                self._busy = False
+
+    def _store(self, profile: StoredProfile):
+        with self._lock:
+            self._profiles[profile.profile_id] = profile
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+            self.profiled += 1
+
+    def get(self, profile_id: str) -> Optional[StoredProfile]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            profiles = list(self._profiles.values())
+        return [profile.summary() for profile in reversed(profiles)]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "header_trigger": bool(self.token),
+            "profiled": self.profiled,
+            "skipped_busy": self.skipped_busy,
+            "stored": len(self._profiles),
+            "max_profiles": self.max_profiles,
+        }
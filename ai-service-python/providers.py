@@ -0,0 +1,142 @@
+import functools
+import hashlib
+import threading
+import time
+from typing import Iterator, Optional
+
+DEFAULT_GEMINI_MODEL = "gemini-2.0-flash-exp"
+
+_STUB_WORDS = (
+    "vehicle service mileage average cost customer dealer region model trend "
+    "increase decrease total record booking parts inventory price month year"
+).split()
+
+
+class ModelProvider:
+    """A text generation backend. Calls are blocking and run on the generation executor."""
+
+    model_name = "unknown"
+
+    def generate(self, prompt: str) -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Answer text in pieces as it is generated"""
+        yield self.generate(prompt)
+
+    def warm_up(self):
+        """Load whatever the first call would otherwise pay for"""
+
+
+class GeminiProvider(ModelProvider):
+    """Google Gemini via google-generativeai, configured on first use since importing the client is slow"""
+
+    # genai.configure is process-wide, so every GeminiProvider shares one configuration
+    _configure_lock = threading.Lock()
+    _configured = False
+
+    def __init__(self, api_key: Optional[str], model_name: str = DEFAULT_GEMINI_MODEL, api_endpoint: Optional[str] = None):
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY environment variable is required")
+        self.api_key = api_key
+        self.model_name = model_name
+        self.api_endpoint = api_endpoint
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _configure(self):
+        with GeminiProvider._configure_lock:
+            if GeminiProvider._configured:
+                return
+            import google.generativeai as genai
+            from google.generativeai import client as genai_client
+
+            if self.api_endpoint:
+                # Any Gemini-compatible REST endpoint, e.g. fake_gemini.py
+                genai.configure(api_key=self.api_key, transport="rest", client_options={"api_endpoint": self.api_endpoint})
+            else:
+                genai.configure(api_key=self.api_key)
+            # The client library retries 503s for up to 60s by itself; the caller owns retries instead
+            service = genai_client.get_default_generative_client()
+            service.generate_content = functools.partial(service.generate_content, retry=None)
+            service.stream_generate_content = functools.partial(service.stream_generate_content, retry=None)
+            GeminiProvider._configured = True
+
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._configure()
+                    import google.generativeai as genai
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    def generate(self, prompt: str) -> str:
+        return self.model().generate_content(prompt).text
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        for chunk in self.model().generate_content(prompt, stream=True):
+            if chunk.text:
+                yield chunk.text
+
+    def warm_up(self):
+        self.model()
+
+
+class StubProvider(ModelProvider):
+    """Deterministic local stand-in for load testing the service without network access.
+
+    Sleeps `latency` seconds (spread across chunks when streaming) and returns
+    `response_chars` of filler text derived from a hash of the prompt, so the
+    same prompt always gets the same answer.
+    """
+
+    def __init__(self, latency: float = 0.0, response_chars: int = 600, chunk_chars: int = 80, model_name: str = "stub"):
+        self.latency = latency
+        self.response_chars = response_chars
+        self.chunk_chars = max(1, chunk_chars)
+        self.model_name = model_name
+
+    def _text(self, prompt: str) -> str:
+        seed = hashlib.sha256(prompt.encode("utf-8")).digest()
+        words = []
+        length = 0
+        i = 0
+        while length < self.response_chars:
+            word = _STUB_WORDS[seed[i % len(seed)] % len(_STUB_WORDS)]
+            words.append(word)
+            length += len(word) + 1
+            i += 1
+        return " ".join(words)[:self.response_chars]
+
+    def generate(self, prompt: str) -> str:
+        time.sleep(self.latency)
+        return self._text(prompt)
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        text = self._text(prompt)
+        chunks = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)] or [""]
+        delay = self.latency / len(chunks)
+        for chunk in chunks:
+            time.sleep(delay)
+            yield chunk
+
+
+def create_provider(kind: str, **options) -> ModelProvider:
+    """Build a model provider from configuration ("gemini" or "stub")"""
+    kind = (kind or "gemini").lower()
+    if kind == "gemini":
+        return GeminiProvider(
+            options.get("api_key"),
+            model_name=options.get("model_name") or DEFAULT_GEMINI_MODEL,
+            api_endpoint=options.get("api_endpoint"),
+        )
+    if kind == "stub":
+        return StubProvider(
+            latency=options.get("latency", 0.0),
+            response_chars=options.get("response_chars", 600),
+            chunk_chars=options.get("chunk_chars", 80),
+            # Keep tiers apart in responses and cache keys when load testing routing
+            model_name=f"stub:{options['model_name']}" if options.get("model_name") else "stub",
+        )
+    raise ValueError(f"Unknown model provider: {kind}")
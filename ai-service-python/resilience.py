@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses worth retrying: quota/rate limit and transient server errors.
+# google.api_core exceptions carry the status in `.code`, so the client
+# library does not need to be imported to classify them.
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class UpstreamUnavailable(Exception):
+    """The upstream model cannot take requests right now; retry after `retry_after` seconds"""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    pass
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    return getattr(error, "code", None) in RETRYABLE_STATUSES
+
+
+class TokenBucket:
+    """Refills `rate_per_minute` units per minute up to `capacity`; `acquire` waits for enough units"""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """Take `amount` units, waiting as long as needed; returns the seconds waited"""
+        # A single request larger than the bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        # The lock keeps waiters first-come, first-served
+        async with self._lock:
+            self._refill()
+            while self._tokens < amount:
+                delay = (amount - self._tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+                self._refill()
+            self._tokens -= amount
+        return waited
+
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+
+class RateLimiter:
+    """Client-side requests-per-minute and tokens-per-minute limits; 0 disables either"""
+
+    def __init__(self, rpm: float = 0, tpm: float = 0):
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.throttled = 0
+        self.waited_seconds = 0.0
+
+    async def acquire(self, tokens: int = 0):
+        waited = 0.0
+        if self.requests:
+            waited += await self.requests.acquire(1)
+        if self.tokens and tokens:
+            waited += await self.tokens.acquire(tokens)
+        if waited:
+            self.throttled += 1
+            self.waited_seconds += waited
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rpm": self.requests.capacity if self.requests else None,
+            "tpm": self.tokens.capacity if self.tokens else None,
+            "throttled": self.throttled,
+            "waited_seconds": round(self.waited_seconds, 3),
+        }
+
+
+class CircuitBreaker:
+    """Stops calling an upstream that keeps failing.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    calls fail fast for `reset_timeout` seconds. Then a single probe call is
+    let through (half-open): success closes the circuit, failure reopens it.
+    Only one probe is admitted per `reset_timeout`.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.trips = 0
+
+    def retry_after(self) -> float:
+        if self.state == self.CLOSED:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        # Open (or half-open with the probe still out): one probe per reset_timeout,
+        # so a probe whose outcome is never recorded cannot wedge the circuit
+        if self.retry_after() <= 0:
+            self.state = self.HALF_OPEN
+            self.opened_at = time.monotonic()
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.trips += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+            "retry_after_seconds": round(self.retry_after(), 1),
+        }
+
+
+class UpstreamGuard:
+    """Rate limiting, jittered exponential retry and a circuit breaker around upstream calls"""
+
+    def __init__(self, limiter: RateLimiter, breaker: CircuitBreaker, max_retries: int = 3,
+                 base_delay: float = 0.5, max_delay: float = 8.0):
+        self.limiter = limiter
+        self.breaker = breaker
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+
+    async def admit(self, cost: int = 0):
+        """Wait for rate-limit headroom, or raise CircuitOpenError if upstream is considered down"""
+        if not self.breaker.allow():
+            raise CircuitOpenError("Upstream model is unavailable", retry_after=self.breaker.retry_after() or 1.0)
+        await self.limiter.acquire(cost)
+
+    def record(self, error: Optional[BaseException] = None):
+        """Feed a call's outcome to the breaker; only retryable errors count as upstream failures"""
+        if error is not None and is_retryable(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: uniform in [0, min(max_delay, base_delay * 2^attempt)]"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def run(self, func: Callable[[], Awaitable[Any]], cost: int = 0) -> Any:
+        attempt = 0
+        while True:
+            await self.admit(cost)
+            try:
+                result = await func()
+            except Exception as e:
+                self.record(e)
+                if not is_retryable(e):
+                    raise
+                if attempt >= self.max_retries:
+                    raise UpstreamUnavailable(f"Upstream model failed after {attempt + 1} attempts: {str(e)}",
+                                              retry_after=self.max_delay) from e
+                delay = self.backoff(attempt)
+                attempt += 1
+                self.retries += 1
+                logger.warning("Retrying upstream call", extra={"delay_seconds": round(delay, 2), "attempt": attempt + 1, "error": str(e)})
+                await asyncio.sleep(delay)
+                continue
+            self.record()
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rate_limit": self.limiter.stats(),
+            "circuit": self.breaker.stats(),
+            "retries": self.retries,
+            "max_retries": self.max_retries,
+        }
@@ -0,0 +1,114 @@
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from classifier import DEFAULT_DATA_TYPE
+from providers import ModelProvider
+
+# Questions asking for reasoning rather than a lookup or a quick summary
+REASONING = re.compile(
+    r"\b(why|explain|compare|comparison|trend|trends|predict|forecast|recommend|suggest|"
+    r"correlat\w*|insight\w*|analy[sz]e|analysis|root cause|optimi[sz]e|strategy)\b"
+)
+
+LOCAL_TIER = "local"
+
+
+class ModelTier:
+    """One model the router can send a prompt to, with its usage counters"""
+
+    def __init__(self, name: str, provider: ModelProvider, cost_per_1k_tokens: float = 0.0):
+        self.name = name
+        self.provider = provider
+        self.cost_per_1k_tokens = cost_per_1k_tokens
+        self.requests = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    @property
+    def model_name(self) -> str:
+        return self.provider.model_name
+
+    def stats(self) -> Dict[str, Any]:
+        tokens = self.input_tokens + self.output_tokens
+        return {
+            "model": self.model_name,
+            "requests": self.requests,
+            "errors": self.errors,
+            "avg_latency_ms": round(self.total_latency / self.requests * 1000, 1) if self.requests else None,
+            "max_latency_ms": round(self.max_latency * 1000, 1),
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "estimated_cost": round(tokens / 1000 * self.cost_per_1k_tokens, 6),
+        }
+
+
+class ModelRouter:
+    """Chooses a model tier per request from prompt size and question complexity.
+
+    Questions the local fast path answers never reach a model; they are
+    counted under the "local" pseudo-tier. Otherwise, in order:
+    - heavy: prompt at or over `heavy_min_tokens`, or a reasoning question
+      ("why", "compare", "forecast", ...) about a recognized kind of sheet
+    - light: prompt within `light_max_tokens` and no reasoning asked for
+    - standard: everything else
+    Light and heavy are optional; without them everything goes to standard.
+    """
+
+    def __init__(self, standard: ModelTier, light: Optional[ModelTier] = None, heavy: Optional[ModelTier] = None,
+                 light_max_tokens: int = 1500, heavy_min_tokens: int = 12000):
+        self.standard = standard
+        self.light = light
+        self.heavy = heavy
+        self.light_max_tokens = light_max_tokens
+        self.heavy_min_tokens = heavy_min_tokens
+        self._lock = threading.Lock()
+        self.local_requests = 0
+        self.local_latency = 0.0
+
+    @property
+    def tiers(self) -> List[ModelTier]:
+        return [tier for tier in (self.light, self.standard, self.heavy) if tier is not None]
+
+    def route(self, prompt_tokens: int, message: str, data_type: Optional[str] = None) -> ModelTier:
+        reasoning = bool(REASONING.search(message.lower()))
+        if self.heavy and (prompt_tokens >= self.heavy_min_tokens or
+                           (reasoning and data_type not in (None, DEFAULT_DATA_TYPE))):
+            return self.heavy
+        if self.light and prompt_tokens <= self.light_max_tokens and not reasoning:
+            return self.light
+        return self.standard
+
+    def record(self, tier: ModelTier, latency: float, input_tokens: int, output_tokens: int, error: bool = False):
+        with self._lock:
+            tier.requests += 1
+            tier.errors += int(error)
+            tier.total_latency += latency
+            tier.max_latency = max(tier.max_latency, latency)
+            tier.input_tokens += input_tokens
+            tier.output_tokens += output_tokens
+
+    def record_local(self, latency: float):
+        with self._lock:
+            self.local_requests += 1
+            self.local_latency += latency
+
+    def stats(self) -> Dict[str, Any]:
+        tiers = {
+            "light": self.light.stats() if self.light else None,
+            "standard": self.standard.stats(),
+            "heavy": self.heavy.stats() if self.heavy else None,
+            LOCAL_TIER: {
+                "requests": self.local_requests,
+                "avg_latency_ms": round(self.local_latency / self.local_requests * 1000, 1) if self.local_requests else None,
+                "estimated_cost": 0.0,
+            },
+        }
+        return {
+            "light_max_tokens": self.light_max_tokens if self.light else None,
+            "heavy_min_tokens": self.heavy_min_tokens if self.heavy else None,
+            "tiers": {name: stats for name, stats in tiers.items() if stats is not None},
+        }
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+# pandas is imported on first use; importing it costs ~0.5s of startup
+if TYPE_CHECKING:
+    import pandas as pd
+
+FINGERPRINT_CHUNK_ROWS = 2000
+NUMERIC_SAMPLE_ROWS = 100
+
+
+def column_names(columns: Optional[List[Dict[str, Any]]]) -> List[str]:
+    """Column names in sheet order, with placeholders for unnamed columns"""
+    return [col.get('name', f'Column_{i}') for i, col in enumerate(columns or [])]
+
+
+def sheet_fingerprint(columns: Optional[List[Dict[str, Any]]], rows: Optional[List[Any]]) -> str:
+    """Stable hash of a sheet's columns and rows, computed without building a DataFrame"""
+    hasher = hashlib.sha256()
+    hasher.update(json.dumps(columns or [], sort_keys=True, default=str).encode("utf-8"))
+    hasher.update(b"\0[")
+    # Serialized a slice at a time: one json.dumps call over a large sheet holds the GIL
+    # long enough to stall the event loop. The bytes hashed are the same as for the whole list.
+    rows = rows or []
+    for start in range(0, len(rows), FINGERPRINT_CHUNK_ROWS):
+        if start:
+            hasher.update(b",")
+        chunk = json.dumps(rows[start:start + FINGERPRINT_CHUNK_ROWS], sort_keys=True, separators=(",", ":"), default=str)
+        hasher.update(chunk[1:-1].encode("utf-8"))
+    hasher.update(b"]")
+    return hasher.hexdigest()
+
+
+def is_arrow_table(data) -> bool:
+    """Whether sheet rows are a pyarrow Table (an uploaded file) rather than a DataFrame, without importing pyarrow"""
+    return type(data).__module__.startswith("pyarrow")
+
+
+class SheetError(ValueError):
+    """Sheet rows that cannot be read as a table (ragged rows, nested cells, duplicate columns)"""
+
+
+def build_frame(columns: Optional[List[Dict[str, Any]]], rows: Optional[List[Any]]) -> "pd.DataFrame":
+    """Convert sheet rows into a typed DataFrame.
+
+    Spreadsheet exports often send numbers as strings, so object columns whose
+    values all parse as numbers are converted to numeric dtypes.
+    """
+    import pandas as pd
+
+    names = column_names(columns)
+    if not rows:
+        return pd.DataFrame(columns=names)
+
+    df = pd.DataFrame(rows, columns=names or None).infer_objects()
+    for name in df.columns[df.dtypes == object]:
+        values = df[name]
+        # A text column usually shows itself in its first values; skip parsing all of them
+        if pd.to_numeric(values.dropna().head(NUMERIC_SAMPLE_ROWS), errors='coerce').isna().any():
+            continue
+        converted = pd.to_numeric(values, errors='coerce')
+        if converted.notna().sum() == values.notna().sum() and values.notna().any():
+            df[name] = converted
+    return df
+
+
+class StoredSheet:
+    """A sheet ingested once and kept server-side between chat turns"""
+
+    def __init__(self, sheet_id: str, sheet_data, store_dir: Optional[str] = None):
+        self.sheet_id = sheet_id
+        self.sheet_data = sheet_data
+        self.store_dir = store_dir  # columnar files backing the sheet, for file uploads
+        self.created_at = datetime.now().isoformat()
+        # Built once here so every later turn reuses the typed rows and stats
+        try:
+            self.columns = sheet_data.stats()
+            self.nbytes = sheet_data.nbytes()
+        except Exception as e:
+            raise SheetError(f"Could not read sheet rows: {e}") from e
+
+    @property
+    def rows(self) -> int:
+        return len(self.sheet_data.data())
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "sheetId": self.sheet_id,
+            "name": self.sheet_data.name,
+            "rowCount": self.sheet_data.rowCount or self.rows,
+            "columns": self.columns,
+            "createdAt": self.created_at,
+        }
+
+
+class SheetRegistry:
+    """In-process store of uploaded sheets, evicting the least recently used beyond
+    max_sheets sheets or max_bytes of rows (the newest sheet is always kept).
+
+    `on_remove` is called with each sheet that is removed or evicted, e.g. to
+    delete the files behind it.
+    """
+
+    def __init__(self, max_sheets: int = 256, max_bytes: int = 1024 * 1024 * 1024,
+                 on_remove: Optional[Callable[[StoredSheet], None]] = None):
+        self.max_sheets = max_sheets
+        self.max_bytes = max_bytes
+        self.on_remove = on_remove
+        self._sheets: "OrderedDict[str, StoredSheet]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def register(self, sheet_data, store_dir: Optional[str] = None) -> StoredSheet:
+        sheet = StoredSheet(uuid.uuid4().hex, sheet_data, store_dir)
+        evicted = []
+        with self._lock:
+            self._sheets[sheet.sheet_id] = sheet
+            self._bytes += sheet.nbytes
+            while len(self._sheets) > 1 and (len(self._sheets) > self.max_sheets or self._bytes > self.max_bytes):
+                old = self._sheets.popitem(last=False)[1]
+                self._bytes -= old.nbytes
+                evicted.append(old)
+        for old in evicted:
+            self._removed(old)
+        return sheet
+
+    def get(self, sheet_id: str) -> Optional[StoredSheet]:
+        with self._lock:
+            sheet = self._sheets.get(sheet_id)
+            if sheet is not None:
+                self._sheets.move_to_end(sheet_id)
+            return sheet
+
+    def remove(self, sheet_id: str) -> bool:
+        with self._lock:
+            sheet = self._sheets.pop(sheet_id, None)
+            if sheet is not None:
+                self._bytes -= sheet.nbytes
+        if sheet is None:
+            return False
+        self._removed(sheet)
+        return True
+
+    def _removed(self, sheet: StoredSheet):
+        if self.on_remove is not None:
+            self.on_remove(sheet)
+
+    def stats(self) -> Dict[str, int]:
+        return {"sheets": len(self._sheets), "max_sheets": self.max_sheets, "bytes": self._bytes, "max_bytes": self.max_bytes}
@@ -0,0 +1,149 @@
+import math
+from typing import TYPE_CHECKING, Any, Dict, List
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+
+QUANTILES = [0.25, 0.5, 0.75]
+
+
+def _number(value) -> Any:
+    """Plain Python number for JSON output, None for NaN"""
+    if value is None:
+        return None
+    value = float(value)
+    if math.isnan(value):
+        return None
+    return int(value) if value.is_integer() else round(value, 4)
+
+
+def summarize_frame(df: "pd.DataFrame", top_k: int = 5) -> Dict[str, Dict[str, Any]]:
+    """Per-column statistics over the whole frame.
+
+    Counts, null rates and cardinality are computed for all columns at once;
+    min/max/mean/quantiles in one vectorized pass over the numeric columns;
+    top-k values for the remaining (categorical) columns.
+    """
+    rows = len(df)
+    counts = df.count()
+    cardinality = df.nunique(dropna=True)
+
+    numeric = df.select_dtypes(include=['number'])
+    numeric_stats = numeric.agg(['min', 'max', 'mean']) if not numeric.empty else None
+    numeric_quantiles = numeric.quantile(QUANTILES) if not numeric.empty else None
+
+    summary = {}
+    for name in df.columns:
+        count = int(counts[name])
+        column = {
+            "dtype": str(df[name].dtype),
+            "count": count,
+            "null_rate": round(1 - count / rows, 4) if rows else 0.0,
+            "cardinality": int(cardinality[name]),
+        }
+        if name in numeric.columns:
+            column.update({
+                "min": _number(numeric_stats.at['min', name]),
+                "max": _number(numeric_stats.at['max', name]),
+                "mean": _number(numeric_stats.at['mean', name]),
+                "quantiles": {
+                    f"p{int(q * 100)}": _number(numeric_quantiles.at[q, name]) for q in QUANTILES
+                },
+            })
+        elif column["cardinality"] < count:
+            # Skip identifier-like columns where every value is unique
+            top = df[name].value_counts(dropna=True).head(top_k)
+            column["top"] = [[str(value), int(freq)] for value, freq in top.items()]
+        summary[str(name)] = column
+    return summary
+
+
+def _dtype_name(kind: "pa.DataType") -> str:
+    """The pandas dtype name of an Arrow type, so prompts read the same for uploaded and inline sheets"""
+    import numpy as np
+    try:
+        return np.dtype(kind.to_pandas_dtype()).name
+    except (NotImplementedError, TypeError):
+        return str(kind)
+
+
+def summarize_table(table: "pa.Table", top_k: int = 5) -> Dict[str, Dict[str, Any]]:
+    """The same statistics as summarize_frame, computed with pyarrow.compute one column at a time.
+
+    For a memory-mapped table only the column being summarized is paged in,
+    and nothing is converted to pandas.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    rows = table.num_rows
+    summary = {}
+    for name, values in zip(table.column_names, table.columns):
+        kind = values.type
+        count = rows - values.null_count
+        column = {
+            "dtype": _dtype_name(kind),
+            "count": count,
+            "null_rate": round(1 - count / rows, 4) if rows else 0.0,
+        }
+        if pa.types.is_nested(kind):
+            # Objects and lists from JSON lines have no distinct-count or sort kernels
+            column["cardinality"] = None
+            summary[str(name)] = column
+            continue
+        column["cardinality"] = pc.count_distinct(values, mode="only_valid").as_py()
+        if pa.types.is_integer(kind) or pa.types.is_floating(kind):
+            extremes = pc.min_max(values)
+            quantiles = pc.quantile(values, q=QUANTILES).to_pylist() if count else [None] * len(QUANTILES)
+            column.update({
+                "min": _number(extremes["min"].as_py()),
+                "max": _number(extremes["max"].as_py()),
+                "mean": _number(pc.mean(values).as_py()),
+                "quantiles": {f"p{int(q * 100)}": _number(value) for q, value in zip(QUANTILES, quantiles)},
+            })
+        elif column["cardinality"] < count:
+            counts = pc.value_counts(pc.drop_null(values))
+            order = pc.array_sort_indices(counts.field("counts"), order="descending")[:top_k]
+            top = counts.take(order)
+            column["top"] = [[str(value), int(freq)] for value, freq in
+                             zip(top.field("values").to_pylist(), top.field("counts").to_pylist())]
+        summary[str(name)] = column
+    return summary
+
+
+def _fmt(value) -> str:
+    if value is None:
+        return "n/a"
+    if isinstance(value, int):
+        return f"{value:,}"
+    return f"{value:,.2f}"
+
+
+def format_stats_for_prompt(summary: Dict[str, Dict[str, Any]], max_columns: int = 40, max_value_length: int = 40) -> str:
+    """Render column statistics as compact prompt lines.
+
+    Output size depends on the number of columns (capped at max_columns),
+    never on the number of rows.
+    """
+    lines: List[str] = []
+    for name, column in list(summary.items())[:max_columns]:
+        parts = [f"n={_fmt(column['count'])}", f"nulls={column['null_rate']:.0%}", f"unique={_fmt(column['cardinality'])}"]
+        if "mean" in column:
+            quantiles = column["quantiles"]
+            parts += [
+                f"min={_fmt(column['min'])}",
+                f"p25={_fmt(quantiles['p25'])}",
+                f"median={_fmt(quantiles['p50'])}",
+                f"p75={_fmt(quantiles['p75'])}",
+                f"max={_fmt(column['max'])}",
+                f"mean={_fmt(column['mean'])}",
+            ]
+        elif column.get("top"):
+            top = ", ".join(f"{value[:max_value_length]} ({_fmt(freq)})" for value, freq in column["top"])
+            parts.append(f"top: {top}")
+        lines.append(f"- {name} ({column['dtype']}): " + ", ".join(parts))
+
+    if len(summary) > max_columns:
+        lines.append(f"- ... {len(summary) - max_columns} more columns not shown")
+    return "\n".join(lines)
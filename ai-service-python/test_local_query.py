@@ -0,0 +1,53 @@
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from local_query import LocalQueryEngine
+
+SERVICES = pd.DataFrame({
+    "Model": ["Golf", "Golf", "Polo", "Polo", "Passat"],
+    "ServiceType": ["Oil Change", "Brake Service", "Oil Change", "Brake Service", "Engine Tuneup"],
+    "Cost": [50, 60, 60, 200, 240],
+})
+
+engine = LocalQueryEngine()
+
+
+# Inline sheets are DataFrames, uploaded files Arrow tables; both must answer alike
+@pytest.fixture(params=["frame", "table"])
+def sheet(request):
+    return SERVICES if request.param == "frame" else pa.Table.from_pandas(SERVICES, preserve_index=False)
+
+
+@pytest.mark.parametrize("question", [
+    "average cost of oil changes",
+    "total cost for Golf",
+    "max cost of Polo",
+    "how many oil changes?",
+    "How many vehicles need brake service?",
+    "count of Polo",
+    "number of services with cost 200",
+])
+def test_filtered_questions_fall_back(sheet, question):
+    assert engine.answer(question, sheet) is None
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("average cost", "Average Cost: **122**"),
+    ("total cost", "Total Cost: **610**"),
+    ("What's the maximum cost?", "Maximum Cost: **240**"),
+    ("average cost by model", "Average Cost by Model:\n- Passat: 240\n- Polo: 130\n- Golf: 55"),
+    ("how many rows are there?", "The sheet has **5** rows."),
+    ("number of records", "The sheet has **5** rows."),
+    ("how many unique models", "Model has **3** distinct values."),
+    ("top 2 service types", "Top 2 ServiceType values:\n- Oil Change: 2\n- Brake Service: 2"),
+])
+def test_plain_aggregations_answered(sheet, question, expected):
+    assert expected in engine.answer(question, sheet)
+
+
+# Inline sheets may send only some rows; rowCount says how many the sheet has
+@pytest.mark.parametrize("question", ["total cost", "how many rows are there?", "top 2 service types"])
+def test_partial_sheet_falls_back(sheet, question):
+    assert engine.answer(question, sheet, row_count=12000) is None
+    assert engine.answer(question, sheet, row_count=len(SERVICES)) is not None
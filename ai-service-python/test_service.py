@@ -44,6 +44,71 @@ def test_chat():
     print(response.json())
     print()
 
+# Test uploading a sheet once and chatting against its ID
+def test_sheet_upload():
+    sheet = {
+        "name": "Vehicle Service Records",
+        "columns": [{"name": "VehicleID"}, {"name": "Mileage"}, {"name": "Cost"}],
+        "dataPreview": [["V1001", 15000, 50], ["V1002", 30000, 75]],
+        "rowCount": 2
+    }
+    response = requests.post("http://localhost:8001/sheets", json=sheet)
+    print("Sheet Upload:")
+    print(response.json())
+    
+    response = requests.post(
+        "http://localhost:8001/chat",
+        json={"message": "What is the average cost?", "token": "test_token", "sheetId": response.json()["sheetId"]}
+    )
+    print("Chat by sheetId:")
+    print(response.json())
+    print()
+
+# Test the streaming chat endpoint
+def test_chat_stream():
+    payload = {
+        "message": "Summarize this data",
+        "token": "test_token",
+        "conversation_history": []
+    }
+    
+    with requests.post(
+        "http://localhost:8001/chat/stream",
+        headers={"Content-Type": "application/json"},
+        data=json.dumps(payload),
+        stream=True
+    ) as response:
+        print("Streaming Chat Response:")
+        for line in response.iter_lines(decode_unicode=True):
+            if line:
+                print(line)
+    print()
+
+# Test asking several questions about one sheet in a single request
+def test_chat_batch():
+    payload = {
+        "questions": ["What is the average cost?", "Which vehicle has the highest mileage?", "Summarize this data"],
+        "token": "test_token",
+        "sheetData": {
+            "name": "Vehicle Service Records",
+            "columns": [{"name": "VehicleID"}, {"name": "Mileage"}, {"name": "Cost"}],
+            "dataPreview": [["V1001", 15000, 50], ["V1002", 30000, 75]],
+            "rowCount": 2
+        }
+    }
+    response = requests.post("http://localhost:8001/chat/batch", json=payload)
+    print("Batch Chat Response:")
+    print(response.json())
+    print()
+
+def test_metrics():
+    response = requests.get("http://localhost:8001/metrics")
+    print("Metrics:")
+    for line in response.text.splitlines():
+        if line.startswith("provolx_stage_duration_seconds_count") or line.startswith("provolx_chat_"):
+            print(line)
+    print()
+
 if __name__ == "__main__":
     print("Testing Provolx AI Service")
     print("=" * 30)
@@ -51,6 +116,10 @@ if __name__ == "__main__":
     try:
         test_health()
         test_chat()
+        test_sheet_upload()
+        test_chat_stream()
+        test_chat_batch()
+        test_metrics()
     except Exception as e:
         print(f"Error testing service: {e}")
         print("Make sure the AI service is running on port 8001")
\ No newline at end of file
@@ -1,226 +1,376 @@
 #!/usr/bin/env python3
 """
-Benchmarking script for Provolx system components
+Load testing harness for Provolx services
+
+Sends requests open-loop: arrivals follow the target rate whether or not
+earlier requests have finished, and latency is measured from each request's
+scheduled send time, so a slow server cannot hide its queueing delay by
+slowing the load generator down. Latencies go into HDR histograms.
+
+Run against the AI service with the stub model (no Gemini key or quota used):
+
+    python benchmark.py --start-stub --scenario ai-chat --rps 10,20,40 --duration 20
+
+or against a running service, saving results and checking them against a baseline:
+
+    python benchmark.py --scenario ai-chat --rps 20 --output results.json --baseline baseline.json
+    python benchmark.py --scenario ai-chat --rps 20 --save-baseline baseline.json
+
+Each comma-separated --rps value is a stage held for --duration seconds, so a
+single run shows how latency, throughput and in-flight requests change as
+load grows. The exit status is 1 when a regression against the baseline is found.
 """
 
-import time
-import requests
+import argparse
+import asyncio
 import json
-import threading
-from concurrent.futures import ThreadPoolExecutor
-import statistics
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+from urllib.parse import urlparse
+
+try:
+    import httpx
+except ImportError:
+    sys.exit("benchmark.py requires httpx (pip install httpx)")
+try:
+    from hdrh.histogram import HdrHistogram
+except ImportError:
+    sys.exit("benchmark.py requires hdrhistogram (pip install hdrhistogram)")
+
+PERCENTILES = {"p50": 50.0, "p90": 90.0, "p99": 99.0, "p99.9": 99.9}
+
+VEHICLE_SHEET = {
+    "name": "Vehicle Maintenance Data",
+    "columns": [
+        {"name": "VehicleID"},
+        {"name": "Model"},
+        {"name": "Year"},
+        {"name": "ServiceType"},
+        {"name": "Mileage"}
+    ],
+    "dataPreview": [
+        ["V1001", "VW Taigun", 2023, "Oil Change", 15000],
+        ["V1002", "VW Taigun", 2023, "Tire Rotation", 30000],
+        ["V1003", "VW Virtus", 2023, "Brake Service", 45000],
+        ["V1004", "VW Tiguan", 2022, "Oil Change", 52000],
+        ["V1005", "VW Virtus", 2022, "Battery Check", 61000]
+    ],
+    "rowCount": 5
+}
+
 
 class ProvolxBenchmark:
-    def __init__(self):
-        self.backend_url = "http://localhost:3000"
-        self.ai_service_url = "http://localhost:8001"
-        self.frontend_url = "http://localhost:5173"
-        
-    def benchmark_backend_health(self):
-        """Benchmark backend health endpoint"""
-        try:
-            start_time = time.time()
-            response = requests.get(f"{self.backend_url}/")
-            end_time = time.time()
-            
-            return {
-                "endpoint": "Backend Health",
-                "response_time": (end_time - start_time) * 1000,  # Convert to milliseconds
-                "status_code": response.status_code,
-                "success": response.status_code == 200
-            }
-        except Exception as e:
-            return {
-                "endpoint": "Backend Health",
-                "error": str(e),
-                "success": False
-            }
-    
-    def benchmark_ai_service_health(self):
-        """Benchmark AI service health endpoint"""
-        try:
-            start_time = time.time()
-            response = requests.get(f"{self.ai_service_url}/health")
-            end_time = time.time()
-            
-            return {
-                "endpoint": "AI Service Health",
-                "response_time": (end_time - start_time) * 1000,
-                "status_code": response.status_code,
-                "success": response.status_code == 200
-            }
-        except Exception as e:
-            return {
-                "endpoint": "AI Service Health",
-                "error": str(e),
-                "success": False
-            }
-    
-    def benchmark_ai_chat_response(self):
-        """Benchmark AI chat response time"""
+    """The requests each scenario sends; `request(scenario, n)` builds the n-th one"""
+
+    SCENARIOS = {
+        "ai-health": "GET /health on the AI service",
+        "ai-chat": "POST /chat with a distinct question each time (reaches the model)",
+        "ai-chat-cached": "POST /chat repeating one question (response cache and coalescing)",
+        "ai-local-query": "POST /chat with aggregations the service answers without a model",
+        "backend-health": "GET / on the backend",
+        "backend-chat-create": "POST /api/chat/create on the backend",
+    }
+
+    def __init__(self, backend_url="http://localhost:3000", ai_service_url="http://localhost:8001"):
+        self.backend_url = backend_url
+        self.ai_service_url = ai_service_url
+
+    def chat_payload(self, message):
+        return {"message": message, "token": "benchmark_token", "sheetData": VEHICLE_SHEET}
+
+    def request(self, scenario, n):
+        """(method, url, json body, expected status) for the n-th request of a scenario"""
+        if scenario == "ai-health":
+            return "GET", f"{self.ai_service_url}/health", None, 200
+        if scenario == "ai-chat":
+            message = f"What maintenance should be planned next for these vehicles? (load test request {n})"
+            return "POST", f"{self.ai_service_url}/chat", self.chat_payload(message), 200
+        if scenario == "ai-chat-cached":
+            message = "What are the common maintenance tasks for a 2023 VW Taigun?"
+            return "POST", f"{self.ai_service_url}/chat", self.chat_payload(message), 200
+        if scenario == "ai-local-query":
+            message = ["average mileage by model", "how many rows", "max mileage"][n % 3]
+            return "POST", f"{self.ai_service_url}/chat", self.chat_payload(message), 200
+        if scenario == "backend-health":
+            return "GET", f"{self.backend_url}/", None, 200
+        if scenario == "backend-chat-create":
+            return "POST", f"{self.backend_url}/api/chat/create", {"userId": "benchmark-user-id"}, 201
+        raise ValueError(f"Unknown scenario: {scenario}")
+
+
+class PhaseResult:
+    """Outcomes of one scenario at one target rate"""
+
+    def __init__(self, scenario, target_rps, timeout):
+        self.scenario = scenario
+        self.target_rps = target_rps
+        # Microseconds, 3 significant digits, up to the request timeout
+        self.histogram = HdrHistogram(1, max(2, int(timeout * 1_000_000)), 3)
+        self.errors = Counter()
+        self.sent = 0
+        self.ok = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.in_flight_total = 0
+        self.max_send_lag = 0.0
+        self.elapsed = 0.0
+
+    def started(self, lag):
+        self.sent += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        # Sampled at every arrival, so the mean is the concurrency arrivals actually saw
+        self.in_flight_total += self.in_flight
+        self.max_send_lag = max(self.max_send_lag, lag)
+
+    def finished(self, latency, error=None):
+        self.in_flight -= 1
+        if error:
+            self.errors[error] += 1
+            return
+        self.ok += 1
+        micros = int(latency * 1_000_000)
+        self.histogram.record_value(min(max(micros, 1), self.histogram.highest_trackable_value))
+
+    def dropped(self):
+        """An arrival skipped because --max-in-flight requests were already outstanding"""
+        self.errors["client_saturated"] += 1
+
+    def report(self):
+        attempted = self.sent + self.errors["client_saturated"]
+        failed = sum(self.errors.values())
+        latency = {name: None for name in PERCENTILES}
+        if self.ok:
+            latency = {name: round(self.histogram.get_value_at_percentile(p) / 1000, 2) for name, p in PERCENTILES.items()}
+            latency["mean"] = round(self.histogram.get_mean_value() / 1000, 2)
+            latency["max"] = round(self.histogram.get_max_value() / 1000, 2)
+        return {
+            "scenario": self.scenario,
+            "target_rps": self.target_rps,
+            "elapsed_s": round(self.elapsed, 2),
+            "requests": attempted,
+            "ok": self.ok,
+            "errors": dict(self.errors.most_common()),
+            "error_rate": round(failed / attempted, 4) if attempted else 0.0,
+            "throughput_rps": round(self.ok / self.elapsed, 2) if self.elapsed else 0.0,
+            "latency_ms": latency,
+            "in_flight": {
+                "peak": self.peak_in_flight,
+                "mean": round(self.in_flight_total / self.sent, 2) if self.sent else 0.0,
+            },
+            "max_send_lag_ms": round(self.max_send_lag * 1000, 2),
+            "histogram": self.histogram.encode().decode("ascii"),
+        }
+
+
+class LoadTest:
+    """Open-loop load generator: constant or Poisson arrivals at a target rate"""
+
+    def __init__(self, benchmark, timeout=30.0, max_in_flight=512, arrival="constant", seed=0):
+        self.benchmark = benchmark
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.arrival = arrival
+        self.random = random.Random(seed)
+        self.counter = 0
+
+    def interval(self, rps):
+        if self.arrival == "poisson":
+            return self.random.expovariate(rps)
+        return 1.0 / rps
+
+    async def send(self, client, scenario, scheduled, result):
+        loop = asyncio.get_running_loop()
+        method, url, body, expected = self.benchmark.request(scenario, self.counter)
+        self.counter += 1
+        result.started(loop.time() - scheduled)
+        error = None
         try:
-            payload = {
-                "message": "What are the common maintenance tasks for a 2023 VW Taigun?",
-                "token": "test_token",
-                "sheetData": {
-                    "name": "Vehicle Maintenance Data",
-                    "columns": [
-                        {"name": "VehicleID"},
-                        {"name": "Model"},
-                        {"name": "Year"},
-                        {"name": "ServiceType"},
-                        {"name": "Mileage"}
-                    ],
-                    "dataPreview": [
-                        ["V1001", "VW Taigun", 2023, "Oil Change", 15000],
-                        ["V1002", "VW Taigun", 2023, "Tire Rotation", 30000],
-                        ["V1003", "VW Taigun", 2023, "Brake Service", 45000]
-                    ],
-                    "rowCount": 3
-                }
-            }
-            
-            start_time = time.time()
-            response = requests.post(
-                f"{self.ai_service_url}/chat",
-                headers={"Content-Type": "application/json"},
-                data=json.dumps(payload)
-            )
-            end_time = time.time()
-            
-            return {
-                "endpoint": "AI Chat Response",
-                "response_time": (end_time - start_time) * 1000,
-                "status_code": response.status_code,
-                "success": response.status_code == 200,
-                "response_length": len(response.text) if response.status_code == 200 else 0
-            }
-        except Exception as e:
-            return {
-                "endpoint": "AI Chat Response",
-                "error": str(e),
-                "success": False
-            }
-    
-    def benchmark_backend_chat_create(self):
-        """Benchmark backend chat session creation"""
+            response = await client.request(method, url, json=body)
+            if response.status_code != expected:
+                error = f"http_{response.status_code}"
+        except httpx.TimeoutException:
+            error = "timeout"
+        except httpx.HTTPError as e:
+            error = type(e).__name__
+        # From the scheduled time, not the actual send, so generator lag counts as latency
+        result.finished(loop.time() - scheduled, error)
+
+    async def run_phase(self, client, scenario, rps, duration):
+        loop = asyncio.get_running_loop()
+        result = PhaseResult(scenario, rps, self.timeout)
+        pending = set()
+        start = loop.time()
+        scheduled = start
+        while scheduled < start + duration:
+            delay = scheduled - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(pending) >= self.max_in_flight:
+                result.dropped()
+            else:
+                task = asyncio.create_task(self.send(client, scenario, scheduled, result))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            scheduled += self.interval(rps)
+        if pending:
+            await asyncio.gather(*pending)
+        result.elapsed = loop.time() - start
+        return result
+
+    async def run(self, scenarios, stages, duration, warmup):
+        limits = httpx.Limits(max_connections=self.max_in_flight, max_keepalive_connections=self.max_in_flight)
+        reports = []
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits) as client:
+            for scenario in scenarios:
+                if warmup > 0:
+                    print(f"Warming up {scenario} at {stages[0]:g} rps for {warmup:g}s...")
+                    await self.run_phase(client, scenario, stages[0], warmup)
+                for rps in stages:
+                    print(f"Running {scenario} at {rps:g} rps for {duration:g}s...")
+                    report = (await self.run_phase(client, scenario, rps, duration)).report()
+                    print_report(report)
+                    reports.append(report)
+        return reports
+
+
+def print_report(report):
+    latency = report["latency_ms"]
+    percentiles = "  ".join(f"{name}={latency[name]}" for name in PERCENTILES)
+    print(f"  {report['ok']}/{report['requests']} ok, {report['throughput_rps']} rps achieved, "
+          f"in flight peak {report['in_flight']['peak']} mean {report['in_flight']['mean']}")
+    print(f"  latency ms: {percentiles}  max={latency.get('max')}")
+    if report["errors"]:
+        print(f"  errors: {report['errors']}")
+
+
+def compare(reports, baseline, tolerance, min_delta_ms):
+    """Regressions of `reports` against a baseline results file, matched on scenario and target rate"""
+    previous = {(r["scenario"], r["target_rps"]): r for r in baseline["results"]}
+    regressions = []
+    for report in reports:
+        base = previous.get((report["scenario"], report["target_rps"]))
+        if base is None:
+            continue
+        label = f"{report['scenario']} @ {report['target_rps']:g} rps"
+        for name in PERCENTILES:
+            old, new = base["latency_ms"].get(name), report["latency_ms"].get(name)
+            if old is None or new is None:
+                continue
+            # Both a relative and an absolute threshold, so sub-millisecond noise is not flagged
+            if new > old * (1 + tolerance) and new - old >= min_delta_ms:
+                regressions.append(f"{label}: {name} {old}ms -> {new}ms")
+        if report["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{label}: throughput {base['throughput_rps']} -> {report['throughput_rps']} rps")
+        if report["error_rate"] > base["error_rate"] + 0.01:
+            regressions.append(f"{label}: error rate {base['error_rate']:.2%} -> {report['error_rate']:.2%}")
+    return regressions
+
+
+def start_stub_service(ai_service_url, latency_ms):
+    """Start ai-service-python/main.py with the stub model and wait until /health answers"""
+    service_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ai-service-python")
+    env = {
+        **os.environ,
+        "MODEL_PROVIDER": "stub",
+        "STUB_LATENCY_MS": str(latency_ms),
+        "PORT": str(urlparse(ai_service_url).port or 8001),
+    }
+    process = subprocess.Popen([sys.executable, "main.py"], cwd=service_dir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"AI service exited with status {process.returncode} during startup")
         try:
-            payload = {
-                "userId": "benchmark-user-id"
-            }
-            
-            start_time = time.time()
-            response = requests.post(
-                f"{self.backend_url}/api/chat/create",
-                headers={"Content-Type": "application/json"},
-                data=json.dumps(payload)
-            )
-            end_time = time.time()
-            
-            return {
-                "endpoint": "Backend Chat Create",
-                "response_time": (end_time - start_time) * 1000,
-                "status_code": response.status_code,
-                "success": response.status_code == 201,
-                "session_id": response.json().get("sessionId") if response.status_code == 201 else None
-            }
-        except Exception as e:
-            return {
-                "endpoint": "Backend Chat Create",
-                "error": str(e),
-                "success": False
-            }
-    
-    def benchmark_concurrent_requests(self, endpoint_func, num_requests=10):
-        """Benchmark concurrent requests to an endpoint"""
-        results = []
-        
-        def make_request():
-            return endpoint_func()
-        
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            futures = [executor.submit(make_request) for _ in range(num_requests)]
-            for future in futures:
-                try:
-                    result = future.result()
-                    results.append(result)
-                except Exception as e:
-                    results.append({
-                        "error": str(e),
-                        "success": False
-                    })
-        
-        # Calculate statistics
-        successful_results = [r for r in results if r.get("success", False) and "response_time" in r]
-        if successful_results:
-            response_times = [r["response_time"] for r in successful_results]
-            return {
-                "concurrent_test": True,
-                "total_requests": num_requests,
-                "successful_requests": len(successful_results),
-                "avg_response_time": statistics.mean(response_times),
-                "min_response_time": min(response_times),
-                "max_response_time": max(response_times),
-                "median_response_time": statistics.median(response_times)
-            }
-        else:
-            return {
-                "concurrent_test": True,
-                "total_requests": num_requests,
-                "successful_requests": 0,
-                "error": "All requests failed"
-            }
-    
-    def run_all_benchmarks(self):
-        """Run all benchmarks and return results"""
-        print("Starting Provolx Benchmark Tests...")
+            if httpx.get(f"{ai_service_url}/health", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    process.terminate()
+    sys.exit("AI service did not become healthy within 60s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Open-loop load test for Provolx services")
+    parser.add_argument("--scenario", action="append", choices=sorted(ProvolxBenchmark.SCENARIOS),
+                        help="scenario to run; repeat for several (default: ai-chat)")
+    parser.add_argument("--rps", default="10", help="target requests/second; comma-separated values run as stages")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per stage")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds at the first stage's rate, not recorded")
+    parser.add_argument("--arrival", choices=["constant", "poisson"], default="constant")
+    parser.add_argument("--max-in-flight", type=int, default=512,
+                        help="outstanding requests before arrivals are dropped as client_saturated")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request timeout in seconds")
+    parser.add_argument("--backend-url", default="http://localhost:3000")
+    parser.add_argument("--ai-service-url", default="http://localhost:8001")
+    parser.add_argument("--start-stub", action="store_true",
+                        help="start the AI service locally with MODEL_PROVIDER=stub for the run")
+    parser.add_argument("--stub-latency-ms", type=int, default=200)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--save-baseline", help="also write results to this baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="relative change in latency or throughput counted as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0,
+                        help="smallest latency increase counted as a regression")
+    args = parser.parse_args()
+
+    scenarios = args.scenario or ["ai-chat"]
+    stages = [float(rps) for rps in args.rps.split(",")]
+    if any(rps <= 0 for rps in stages):
+        parser.error("--rps values must be positive")
+
+    benchmark = ProvolxBenchmark(args.backend_url, args.ai_service_url)
+    load_test = LoadTest(benchmark, timeout=args.timeout, max_in_flight=args.max_in_flight, arrival=args.arrival)
+
+    print("Starting Provolx load test...")
+    print("=" * 50)
+    service = start_stub_service(args.ai_service_url, args.stub_latency_ms) if args.start_stub else None
+    try:
+        reports = asyncio.run(load_test.run(scenarios, stages, args.duration, args.warmup))
+    finally:
+        if service is not None:
+            service.terminate()
+            service.wait()
+
+    results = {
+        "created": datetime.now().isoformat(),
+        "config": {
+            "stages_rps": stages,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "arrival": args.arrival,
+            "max_in_flight": args.max_in_flight,
+            "stub_latency_ms": args.stub_latency_ms if args.start_stub else None,
+        },
+        "results": reports,
+    }
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(reports, baseline, args.tolerance, args.min_delta_ms)
+        print("\n" + "=" * 50)
+        print("BASELINE COMPARISON")
         print("=" * 50)
-        
-        results = []
-        
-        # Single request benchmarks
-        benchmarks = [
-            self.benchmark_backend_health,
-            self.benchmark_ai_service_health,
-            self.benchmark_ai_chat_response,
-            self.benchmark_backend_chat_create
-        ]
-        
-        for benchmark in benchmarks:
-            print(f"Running {benchmark.__name__}...")
-            result = benchmark()
-            results.append(result)
-            print(f"  Result: {result}")
-        
-        # Concurrent request benchmarks
-        print("\nRunning concurrent request benchmarks...")
-        concurrent_results = [
-            self.benchmark_concurrent_requests(self.benchmark_backend_health, 20),
-            self.benchmark_concurrent_requests(self.benchmark_ai_chat_response, 10)
-        ]
-        
-        for result in concurrent_results:
-            results.append(result)
-            print(f"  Concurrent Result: {result}")
-        
-        return results
+        if regressions:
+            print(f"{len(regressions)} regression(s):")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print("No regressions")
+
 
 if __name__ == "__main__":
-    benchmark = ProvolxBenchmark()
-    results = benchmark.run_all_benchmarks()
-    
-    # Print summary
-    print("\n" + "=" * 50)
-    print("BENCHMARK SUMMARY")
-    print("=" * 50)
-    
-    successful = [r for r in results if r.get("success", False) or r.get("concurrent_test", False)]
-    failed = [r for r in results if not r.get("success", True) and not r.get("concurrent_test", False)]
-    
-    print(f"Successful tests: {len(successful)}")
-    print(f"Failed tests: {len(failed)}")
-    
-    if failed:
-        print("\nFailed tests:")
-        for result in failed:
-            print(f"  - {result.get('endpoint', 'Unknown')}: {result.get('error', 'Unknown error')}")
\ No newline at end of file
+    main()